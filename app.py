@@ -1,24 +1,46 @@
 #
 # app.py
 #
+import time
+# taken before anything heavy is imported, for the startup time in main()
+STARTED = time.perf_counter()
+
 import pygame
 from pygame import Color, Rect
 import sys
+import os
 import math
 import random
+from collections import OrderedDict
+import numpy as np
 
 from pygame.display import flip
 from map import Map
 from objects import *
+from registry import ObjectRegistry
+from pool import ParticlePool
+from particles import Particles
+from profiler import Profiler
+import snapshot
+import assets
+from rewind import Rewind
+
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
 
 class Game:
+    # frames are drawn at pico-8 resolution and scaled to the window once
+    NATIVE_WIDTH = 16 * 8
+    NATIVE_HEIGHT = 16 * 8
     SCALE = 2
     SCREEN_WIDTH = 16 * 8 * SCALE
     SCREEN_HEIGHT = 16 * 8 * SCALE
     TILE_ROW = 16
     TILE_COL = 16
-    TILE_WIDTH = 8 * SCALE
-    TILE_HEIGHT = 8 * SCALE
+    TILE_WIDTH = 8
+    TILE_HEIGHT = 8
+    # pre-rendered room tile layers kept around across room changes, the
+    # default holds every room so games in different rooms never evict
+    LAYER_CACHE = 32
 
     INPUT_LEFT = pygame.K_a
     INPUT_RIGHT = pygame.K_d
@@ -26,8 +48,39 @@ class Game:
     INPUT_DOWN = pygame.K_s
     INPUT_JUMP = pygame.K_j
     INPUT_DASH = pygame.K_k
+    INPUT_REWIND = pygame.K_r
 
     FONTMAP = "abcdefghijklmnopqrstuvwxyz0123456789~!@#4%^&*()_+-=?:."
+    # first occurrence wins, like the old linear search
+    FONTINDEX = {char: i for i, char in reversed(list(enumerate(FONTMAP)))}
+    # rendered (text, color) surfaces kept for print, 0 turns it off
+    TEXT_CACHE = 64
+    # surfaces that never change once drawn are shared by every Game in
+    # the process: room layers, print() strings and rectfills() colors
+    layers = OrderedDict()
+    texts = OrderedDict()
+    fills = {}
+    # tile -> (class, attributes set after construction, fruit) of the
+    # objects load_room spawns. fruit None spawns always, False only while
+    # the room's fruit is not collected, True only after
+    SPAWNS = {
+        1: (PlayerSpawn, (), None),
+        18: (Spring, (), None),
+        22: (Balloon, (), None),
+        23: (FallFloor, (), None),
+        86: (Message, (), None),
+        96: (BigChest, (), None),
+        118: (Flag, (), None),
+        64: (FakeWall, (), None),
+        26: (Fruit, (), False),
+        28: (FlyFruit, (), False),
+        8: (Key, (), False),
+        20: (Chest, (), False),
+        11: (Platform, (('dir', -1),), None),
+        12: (Platform, (('dir', 1),), None),
+    }
+    # most live instances of each pooled class, see pool.py
+    PARTICLE_POOLS = {Smoke: 48, Lifeup: 8}
 
     COLORS = [
             pygame.Color("#000000"),
@@ -48,15 +101,33 @@ class Game:
             pygame.Color("#ffccaa")
     ]
 
-    class DeadParticle:
-        def __init__(self, x, y, t, spd) -> None:
-            self.x = x
-            self.y = y
-            self.t = t
-            self.spd = spd
-            print(spd.x, spd.y)
-
-    def __init__(self):
+    BUTTONS = ['left', 'right', 'up', 'down', 'jump', 'dash']
+
+    def __init__(self, surface=None, dirty_rects=False, scaler='nearest', seed=None, debug=False):
+        # surface is None for headless games: the simulation still runs
+        # every draw() but the drawing primitives skip the pixel work.
+        # otherwise everything is drawn into the 128x128 canvas, which is
+        # scaled onto surface at the end of render() with scaler
+        # ('nearest' or 'smooth'). a 128x128 surface is drawn into directly.
+        self.surface = None
+        self.canvas = None
+        self.frame = None
+        self.scaler = scaler
+        # prints room changes and player events to the console
+        self.debug = debug
+        # assets.Atlas pages, loaded once there is something to draw on
+        self.sprites = None
+        self.font = None
+        self.set_surface(surface)
+        # all game randomness comes from here, so a seed and the inputs
+        # of every frame reproduce a run exactly
+        self.seed = seed
+        self.rng = random.Random(seed)
+        # with dirty_rects, present() only updates what was drawn this
+        # frame and the frame before instead of flipping the whole display
+        self.drawn = [] if dirty_rects else None
+        self.last_drawn = []
+        self.present_state = None
         self.frames = 0
         self.deaths = 0
         self.will_restart = False
@@ -70,33 +141,61 @@ class Game:
         self.room_y = 0
         self.freeze = 0
         self.map = Map(self)
-        self.sprites = []
-        self.font = []
+        self.flag_sums = None
+        self.spike_sums = None
+        self.layer = None
         self.objects = []
+        self.registry = ObjectRegistry()
+        self.pools = {cls: ParticlePool(cls, n) for cls, n in Game.PARTICLE_POOLS.items()}
+        # resolve solid movement with ClassicObject.sweep_x/sweep_y instead
+        # of stepping through is_solid one pixel at a time
+        self.swept = False
+        # set by Profiler.attach
+        self.profiler = None
+        # a rewind.Rewind fed with a save state every step
+        self.rewind = None
         self.pause_player = False
         self.flash_bg = False
         self.new_bg = False
         self.start_game = False
         self.start_game_flash = 0
         self.got_fruit = {}
-        self.dead_particles = []
+        self.dead_particles = Particles()
         self.inputs = { 'up' : False, 'down' : False, 'left' : False, 'right' : False, 'jump' : False, 'dash' : False }
-        atlas = pygame.image.load('atlas.png')
-        for y in range(0, int(atlas.get_height() / 8)):
-            for x in range(0, int(atlas.get_width() / 8)):
-                self.sprites.append(pygame.transform.scale_by(atlas.subsurface((x * 8, y * 8, 8, 8)), Game.SCALE))
-        font_atlas = pygame.image.load('font.png')
-        for y in range(0, int(font_atlas.get_height() / 6)):
-            for x in range(0, int(font_atlas.get_width() / 4)):
-                self.font.append(pygame.transform.scale_by(font_atlas.subsurface((x * 4, y * 6, 4, 6)), Game.SCALE))
+        # called as input_source(G) at the start of every step() to set
+        # G.inputs, None leaves them to whoever drives the game
+        self.input_source = None
 
         #self.load_room(6, 3)
         self.title_screen()
 
+    def add_object(self, obj):
+        obj.slot = len(self.objects)
+        self.objects.append(obj)
+        self.registry.add(obj)
+
     def destroy_object(self, obj):
-        if self.objects.count(obj) > 0:
-            index = self.objects.index(obj)
+        # the slot is left None until compact_objects(), so a running loop
+        # over objects is not disturbed
+        index = obj.slot
+        if index is not None and index < len(self.objects) and self.objects[index] is obj:
             self.objects[index] = None
+            obj.slot = None
+            self.registry.remove(obj)
+            pool = self.pools.get(type(obj))
+            if pool is not None:
+                pool.release(obj)
+
+    def compact_objects(self):
+        # drops destroyed slots in one pass, keeping the order
+        objects = self.objects
+        n = 0
+        for obj in objects:
+            if obj is not None:
+                obj.slot = n
+                objects[n] = obj
+                n += 1
+        del objects[n:]
 
     def kill_player(self, obj):
         self.deaths += 1
@@ -104,14 +203,11 @@ class Game:
         self.destroy_object(obj)
 
         self.dead_particles.clear()
-        for dir in range(0, 8):
-            angel = dir / 8.0
-            self.dead_particles.append(Game.DeadParticle(
-                obj.x + 4,
-                obj.y + 4,
-                10,
-                pygame.Vector2(math.cos(angel) * 3, math.sin(angel + 0.5) * 3)
-            ))
+        angles = [dir / 8.0 for dir in range(0, 8)]
+        self.dead_particles.add(obj.x + 4, obj.y + 4,
+                                spd_x=[math.cos(angel) * 3 for angel in angles],
+                                spd_y=[math.sin(angel + 0.5) * 3 for angel in angles],
+                                t=10)
 
         self.restart_room()
         
@@ -125,54 +221,62 @@ class Game:
         right = int(min(15, (x + w - 1) / 8))
         bottom = int(max(0, math.floor(y / 8)))
         top = int(min(15, (y + h - 1) / 8))
-        for i in range(left, right + 1):
-            for j in range(bottom, top + 1):
-                if self.map.fget(self.tile_at(i, j), flag):
-                    return True
-        return False
+        if left > right or bottom > top or flag >= len(self.flag_sums):
+            return False
+        sums = self.flag_sums[flag]
+        return sums[right + 1 + (top + 1) * 17] - sums[right + 1 + bottom * 17] - \
+               sums[left + (top + 1) * 17] + sums[left + bottom * 17] > 0
     
     def spikes_at(self, x, y, w, h, xspd, yspd):
-        left = int(max(0, math.floor(x / 8)))
+        # a spike only hurts when moving into it and when the hitbox edge
+        # facing it is within its band: the bottom 2 rows of an upward
+        # spike tile, the top 3 of a downward one, the same for walls.
+        # the tile range is worked out once for all four spike tables
+        # x // 8 is floor(x / 8), dividing by 8 is exact
+        left = max(0, int(x // 8))
         right = int(min(15, (x + w - 1) / 8))
-        bottom = int(max(0, math.floor(y / 8)))
+        bottom = max(0, int(y // 8))
         top = int(min(15, (y + h - 1) / 8))
-        for i in range(left, right + 1):
-            for j in range(bottom, top + 1):
-                tile = self.tile_at(i, j)
-                if tile == 17 and ((y + h - 1) % 8 >= 6 or y + h == j * 8 + 8) and yspd >= 0:
-                    return True
-                elif tile == 27 and y % 8 <= 2 and yspd <= 0:
-                    return True
-                elif tile == 43 and x % 8 <= 2 and xspd <= 0:
-                    return True
-                elif tile ==59 and ((x + w - 1) % 8 >= 6 or x + w == i * 8 + 8) and xspd >= 0:
-                    return True
-        return False
+        if left > right or bottom > top:
+            return False
+        a = right + 1 + (top + 1) * 17
+        b = right + 1 + bottom * 17
+        c = left + (top + 1) * 17
+        d = left + bottom * 17
+        up, down, rightward, leftward = self.spike_sums
+        return (yspd >= 0 and (y + h - 1) % 8 >= 6 and up[a] - up[b] - up[c] + up[d] > 0) or \
+               (yspd <= 0 and y % 8 <= 2 and down[a] - down[b] - down[c] + down[d] > 0) or \
+               (xspd <= 0 and x % 8 <= 2 and rightward[a] - rightward[b] - rightward[c] + rightward[d] > 0) or \
+               (xspd >= 0 and (x + w - 1) % 8 >= 6 and leftward[a] - leftward[b] - leftward[c] + leftward[d] > 0)
 
     def tile_at(self, x, y):
         return self.map.mget(self.room_x * 16 + x, self.room_y * 16 + y)
 
     def draw_grid(self):
+        if self.canvas is None:
+            return
         white = Color(255, 255, 255)
         # draw Vertical lines
-        for x in range(0, Game.SCREEN_WIDTH, Game.TILE_WIDTH):
-            pygame.draw.line(SURFACE, white, (x, 0), (x, Game.SCREEN_HEIGHT))
+        for x in range(0, Game.NATIVE_WIDTH, Game.TILE_WIDTH):
+            pygame.draw.line(self.canvas, white, (x, 0), (x, Game.NATIVE_HEIGHT))
         # draw Horizontal lines
-        for y in range(0, Game.SCREEN_HEIGHT, Game.TILE_HEIGHT):
-            pygame.draw.line(SURFACE, white, (0, y), (Game.SCREEN_WIDTH, y))
+        for y in range(0, Game.NATIVE_HEIGHT, Game.TILE_HEIGHT):
+            pygame.draw.line(self.canvas, white, (0, y), (Game.NATIVE_WIDTH, y))
     
     def draw_circfill(self, x, y, r, c):
+        if self.canvas is None:
+            return
         color = Game.COLORS[int(c) % 16]
         if r <= 1:
-            pygame.draw.rect(SURFACE, color, ((x - 1) * Game.SCALE, y * Game.SCALE, 3 * Game.SCALE, 1 * Game.SCALE))
-            pygame.draw.rect(SURFACE, color, (x * Game.SCALE, (y - 1) * Game.SCALE, 1 * Game.SCALE, 3 * Game.SCALE))
+            self.mark(pygame.draw.rect(self.canvas, color, (x - 1, y, 3, 1)))
+            self.mark(pygame.draw.rect(self.canvas, color, (x, y - 1, 1, 3)))
         elif r <= 2:
-            pygame.draw.rect(SURFACE, color, ((x - 2) * Game.SCALE, (y - 1) * Game.SCALE, 5 * Game.SCALE, 3 * Game.SCALE))
-            pygame.draw.rect(SURFACE, color, ((x - 1) * Game.SCALE, (y - 2) * Game.SCALE, 3 * Game.SCALE, 5 * Game.SCALE))
+            self.mark(pygame.draw.rect(self.canvas, color, (x - 2, y - 1, 5, 3)))
+            self.mark(pygame.draw.rect(self.canvas, color, (x - 1, y - 2, 3, 5)))
         elif r <= 3:
-            pygame.draw.rect(SURFACE, color, ((x - 3) * Game.SCALE, (y - 1) * Game.SCALE, 7 * Game.SCALE, 3 * Game.SCALE))
-            pygame.draw.rect(SURFACE, color, ((x - 1) * Game.SCALE, (y - 3) * Game.SCALE, 3 * Game.SCALE, 7 * Game.SCALE))
-            pygame.draw.rect(SURFACE, color, ((x - 2) * Game.SCALE, (y - 2) * Game.SCALE, 5 * Game.SCALE, 5 * Game.SCALE))
+            self.mark(pygame.draw.rect(self.canvas, color, (x - 3, y - 1, 7, 3)))
+            self.mark(pygame.draw.rect(self.canvas, color, (x - 1, y - 3, 3, 7)))
+            self.mark(pygame.draw.rect(self.canvas, color, (x - 2, y - 2, 5, 5)))
     
     def title_screen(self):
         self.got_fruit = {}
@@ -200,14 +304,14 @@ class Game:
                 self.will_restart = False
                 self.load_room(self.room_x, self.room_y)
 
-        for obj in self.objects:
-            if obj:
-                obj.move(obj.spd.x, obj.spd.y)
-                obj.update()
-        
-        c = self.objects.count(None)
-        for i in range(0, c):
-            self.objects.remove(None)
+        if self.profiler is None:
+            for obj in self.objects:
+                if obj:
+                    obj.move(obj.spd_x, obj.spd_y)
+                    obj.update()
+        else:
+            self.profiler.update_objects(self)
+        self.compact_objects()
 
         if self.is_title():
             if not self.start_game and (self.btn('jump') or self.btn('dash')):
@@ -220,75 +324,292 @@ class Game:
 
 
     def render(self):
+        prof = self.profiler
+        if prof:
+            lap = prof.clock()
         if self.shake > 0:
             self.shake -= 1
             self.shakeoffset = pygame.Vector2(0, 0)
             if self.shake > 0:
-                self.shakeoffset = pygame.Vector2(random.randint(0, 5), random.randint(0, 5))
+                self.shakeoffset = pygame.Vector2(self.rng.randint(0, 5), self.rng.randint(0, 5))
                 
         #self.draw_grid() 
-        self.map.draw(self.room_x * 16, self.room_y * 16, 0, 0, 16, 16, 2)
-        self.map.draw(self.room_x * 16, self.room_y * 16, 0, 0, 16, 16, 1)
+        if self.canvas is not None:
+            if self.layer is None:
+                self.layer = self.room_layer(self.room_x, self.room_y)
+            self.canvas.blit(self.layer, (0, 0))
+        if prof:
+            lap = prof.lap('map', lap)
 
         for obj in self.objects:
-            obj.draw()
+            if obj is not None:
+                obj.draw()
+        if prof:
+            lap = prof.lap('draw', lap)
         
-        for i in range(0, len(self.dead_particles)):
-            p = self.dead_particles[i]
-            p.x += p.spd.x
-            p.y += p.spd.y
-            p.t -= 1
-            if p.t <= 0:
-                self.dead_particles[i] = None
-            self.rectfill(p.x - p.t / 5, p.y - p.t / 5, p.x + p.t / 5, p.y + p.t / 5, int(14 + p.t % 2))
-        c = self.dead_particles.count(None)
-        for i in range(0, c):
-            self.dead_particles.remove(None)
+        dead = self.dead_particles
+        if len(dead):
+            dead.step()
+            size = dead.t / 5
+            self.rectfills(dead.x - size, dead.y - size, dead.x + size, dead.y + size, 14 + dead.t % 2)
+            dead.keep(dead.t > 0)
+        if prof:
+            lap = prof.lap('particles', lap)
 
         if self.is_title():
             self.print("press button", 42, 96, 5)
             self.print("firemoon", 50, 106, 5)
+
+        if prof and prof.overlay:
+            prof.draw_overlay(self)
+
+        if self.canvas is not None and self.canvas is not self.surface:
+            self.upscale()
+        elif self.canvas is not None and (self.shakeoffset.x != 0 or self.shakeoffset.y != 0):
+            self.shake_canvas()
         
        
+    def bg_color(self):
+        if self.flash_bg:
+            return Game.COLORS[int(self.frames / 5)]
+        elif self.new_bg:
+            return Game.COLORS[2]
+        return Game.COLORS[0]
+
+    def step(self, draw=True):
+        # one fixed 30hz tick, no clock and no event pumping. with draw
+        # False the frame is stepped like a headless game, for frames
+        # nobody looks at; the canvas keeps the last drawn frame. draw can
+        # also be a function of the game, asked after update() whether
+        # this frame is drawn, e.g. only the frame the player dies on
+        if self.profiler:
+            self.profiler.begin_frame()
+        if self.input_source is not None:
+            self.input_source(self)
+        canvas = self.canvas
+        bg = self.bg_color()
+        if callable(draw) or not draw:
+            self.canvas = None
+        if self.canvas is not None:
+            self.canvas.fill(bg)
+        self.update()
+        if callable(draw) and canvas is not None and draw(self):
+            self.canvas = canvas
+            self.canvas.fill(bg)
+        if self.rewind is not None:
+            self.rewind.push(self)
+        self.render()
+        self.canvas = canvas
+
+    def redraw(self):
+        # renders the current state again, used after stepping back
+        if self.canvas is not None:
+            self.canvas.fill(self.bg_color())
+        self.render()
+
+    def set_surface(self, surface):
+        # can be called at any time, e.g. when the window is resized;
+        # sprites are native size so nothing has to be reloaded
+        native = (Game.NATIVE_WIDTH, Game.NATIVE_HEIGHT)
+        if surface is None:
+            canvas = None
+        elif surface.get_size() == native:
+            canvas = surface
+        elif self.canvas is not None and self.canvas is not self.surface:
+            canvas = self.canvas
+        else:
+            canvas = pygame.Surface(native)
+        self.surface = surface
+        self.canvas = canvas
+        self.frame = None
+        if canvas is not None:
+            self.load_assets()
+
+    def load_assets(self):
+        # shared by every Game, so only the first one pays for loading
+        if self.sprites is None:
+            self.sprites = assets.atlas(os.path.join(ASSET_DIR, 'atlas.png'), 8, 8)
+            self.font = assets.atlas(os.path.join(ASSET_DIR, 'font.png'), 4, 6)
+
+    def upscale(self):
+        # the finished canvas is scaled straight onto the target. a shaken
+        # frame is scaled into self.frame first and blitted moved by the
+        # offset, in target pixels
+        size = self.surface.get_size()
+        shaken = self.shakeoffset.x != 0 or self.shakeoffset.y != 0
+        if shaken:
+            if self.frame is None or self.frame.get_size() != size:
+                self.frame = pygame.Surface(size)
+            target = self.frame
+        else:
+            target = self.surface
+        if self.scaler == 'smooth':
+            pygame.transform.smoothscale(self.canvas, size, target)
+        else:
+            pygame.transform.scale(self.canvas, size, target)
+        if shaken:
+            self.surface.fill(self.bg_color())
+            self.surface.blit(self.frame, (-self.shakeoffset.x, -self.shakeoffset.y))
+
+    def shake_canvas(self):
+        # a native size target is the canvas itself, so the finished frame
+        # is moved in place like upscale() moves it on the target
+        dx = int(self.shakeoffset.x)
+        dy = int(self.shakeoffset.y)
+        width, height = self.canvas.get_size()
+        self.canvas.scroll(-dx, -dy)
+        if dx:
+            self.canvas.fill(self.bg_color(), (width - dx, 0, dx, height))
+        if dy:
+            self.canvas.fill(self.bg_color(), (0, height - dy, width, dy))
+        self.mark(self.canvas.get_rect())
+
+    def room_layer(self, x, y):
+        # the room's static tiles drawn once into a transparent surface
+        key = (x, y)
+        layer = self.layers.get(key)
+        if layer is not None:
+            self.layers.move_to_end(key)
+            return layer
+
+        layer = pygame.Surface((Game.NATIVE_WIDTH, Game.NATIVE_HEIGHT), pygame.SRCALPHA)
+        canvas = self.canvas
+        self.canvas = layer
+        self.map.draw(x * 16, y * 16, 0, 0, 16, 16, 2)
+        self.map.draw(x * 16, y * 16, 0, 0, 16, 16, 1)
+        self.canvas = canvas
+
+        self.layers[key] = layer
+        if len(self.layers) > Game.LAYER_CACHE:
+            self.layers.popitem(last=False)
+        return layer
+
+    def mark(self, rect):
+        if self.drawn is not None:
+            self.drawn.append(rect)
+
+    def present(self):
+        if self.profiler:
+            start = self.profiler.clock()
+            self.flip()
+            self.profiler.add('present', self.profiler.clock() - start)
+            self.profiler.end_frame(self)
+        else:
+            self.flip()
+
+    def flip(self):
+        if self.drawn is None:
+            pygame.display.flip()
+            return
+        # anything that moves or recolors the whole frame needs a full flip
+        size = self.surface.get_size()
+        state = (size, self.room_x, self.room_y, self.shakeoffset.x, self.shakeoffset.y, self.new_bg)
+        if self.flash_bg or state != self.present_state:
+            pygame.display.flip()
+        else:
+            # canvas rects to target pixels, padded for the smooth scaler
+            sx = size[0] / Game.NATIVE_WIDTH
+            sy = size[1] / Game.NATIVE_HEIGHT
+            px = math.ceil(sx) + 1
+            py = math.ceil(sy) + 1
+            rects = []
+            for r in self.drawn + self.last_drawn:
+                rects.append(Rect(r.x * sx - self.shakeoffset.x - px, r.y * sy - self.shakeoffset.y - py, r.w * sx + 2 * px, r.h * sy + 2 * py))
+            pygame.display.update(rects)
+        self.present_state = state
+        self.last_drawn = self.drawn
+        self.drawn = []
+
     def draw_tile(self, idx, tx, ty):
+        if self.canvas is None:
+            return
         if idx < len(self.sprites):
-            SURFACE.blit(self.sprites[idx], (tx * Game.SCALE - self.shakeoffset.x, ty * Game.SCALE - self.shakeoffset.y, 8 * Game.SCALE, 8 * Game.SCALE))
+            self.canvas.blit(self.sprites.surface, (tx, ty), self.sprites.rects[idx])
         else:
             print("sprite out of range")
 
     def draw_spr(self, idx, x, y, columns = 1, rows = 1, flipX = False, flipY = False):
+        if self.canvas is None:
+            return
+        page = self.sprites
+        if flipX or flipY:
+            page = page.flipped(bool(flipX), bool(flipY))
         for sx in range(0, columns):
             for sy in range(0, rows):
-                spr = self.sprites[int(idx + sx + sy * 16)]
-                if flipX or flipY:
-                    spr = pygame.transform.flip(spr, flipX, flipY)
-                SURFACE.blit(spr, ((x + sx * 8) * Game.SCALE - self.shakeoffset.x, (y + sy * 8) * Game.SCALE - self.shakeoffset.y))
-    
+                index = int(idx + sx + sy * 16)
+                self.mark(self.canvas.blit(page.surface, (x + sx * 8, y + sy * 8), page.rects[index]))
+
     def rectfill(self, x, y, x2, y2, c):
+        if self.canvas is None:
+            return
         left = min(x, x2)
         top = min(y, y2)
         width = max(x, x2) - left + 1
         height = max(y, y2) - top + 1
-        pygame.draw.rect(SURFACE, Game.COLORS[int(c) % 16], (left * Game.SCALE, top * Game.SCALE, width * Game.SCALE, height * Game.SCALE))
+        self.mark(pygame.draw.rect(self.canvas, Game.COLORS[int(c) % 16], (left, top, width, height)))
     
+    def rectfills(self, x, y, x2, y2, c):
+        # rectfill over arrays of corners (c an array or one color), drawn
+        # in order with a single blits call
+        if self.canvas is None or len(x) == 0:
+            return
+        left = np.minimum(x, x2)
+        top = np.minimum(y, y2)
+        # truncated like pygame truncates rectfill's float rects
+        width = (np.maximum(x, x2) - left + 1).astype(int)
+        height = (np.maximum(y, y2) - top + 1).astype(int)
+        left = left.astype(int)
+        top = top.astype(int)
+        colors = np.broadcast_to(np.asarray(c).astype(int) % 16, left.shape)
+        fill = self.fill_surface
+        self.canvas.blits([(fill(color), (l, t), (0, 0, w, h)) for l, t, w, h, color in
+                           zip(left.tolist(), top.tolist(), width.tolist(), height.tolist(), colors.tolist())], False)
+        l = int(left.min())
+        t = int(top.min())
+        self.mark(Rect(l, t, int((left + width).max()) - l, int((top + height).max()) - t))
+
+    def fill_surface(self, c):
+        fill = self.fills.get(c)
+        if fill is None:
+            fill = pygame.Surface((Game.NATIVE_WIDTH, Game.NATIVE_HEIGHT))
+            fill.fill(Game.COLORS[c])
+            self.fills[c] = fill
+        return fill
+
     def print(self, str, x, y, c):
+        if self.canvas is None:
+            return
+        c = int(c) % 16
+        if Game.TEXT_CACHE > 0:
+            self.mark(self.canvas.blit(self.text_surface(str, c), (x, y)))
+            return
         left = x
-        color = Game.COLORS[int(c) % 16]
-        for i in range(0, len(str)):
-            char = str[i]
-            index = -1
-            for j in range(0, len(Game.FONTMAP)):
-                if Game.FONTMAP[j] == char:
-                    index = j
-                    break
+        for char in str:
+            index = Game.FONTINDEX.get(char, -1)
             if index >= 0:
-                s = pygame.surface.Surface((8,12))
-                s.fill(color)
-                d = self.font[index].copy()
-                d.blit(s, (0, 0), special_flags=pygame.BLEND_MIN)
-                SURFACE.blit(d, (left * Game.SCALE - self.shakeoffset.x, y * Game.SCALE - self.shakeoffset.y))
+                font = self.font.tinted(Game.COLORS[c])
+                self.mark(self.canvas.blit(font.surface, (left, y), font.rects[index]))
             left += 4
 
+    def text_surface(self, str, c):
+        # a whole string in one transparent surface, LRU cached
+        key = (str, c)
+        text = self.texts.get(key)
+        if text is not None:
+            self.texts.move_to_end(key)
+            return text
+
+        text = pygame.Surface((len(str) * 4, 6), pygame.SRCALPHA)
+        font = self.font.tinted(Game.COLORS[c])
+        for i in range(0, len(str)):
+            index = Game.FONTINDEX.get(str[i], -1)
+            if index >= 0:
+                text.blit(font.surface, (i * 4, 0), font.rects[index])
+        self.texts[key] = text
+        if len(self.texts) > Game.TEXT_CACHE:
+            self.texts.popitem(last=False)
+        return text
+
     def level_index(self):
         return self.room_x % 8 + self.room_y * 8
     
@@ -300,91 +621,99 @@ class Game:
         self.delay_restart = 15
 
     def load_room(self, x, y):
+        prof = self.profiler
+        if prof:
+            start = prof.clock()
         self.has_dashed = False
         self.room_x = x
         self.room_y = y
-        print("room {} {}".format(x, y))
+        self.flag_sums = self.map.flag_sums(x, y)
+        self.spike_sums = self.map.spike_sums(x, y)
+        self.layer = self.room_layer(x, y) if self.canvas is not None else None
+        if self.debug:
+            print("room {} {}".format(x, y))
 
         self.objects.clear()
-        k = 1 + self.level_index()
-        
-        for tx in range(0, 16):
-            for ty in range(0, 16):
-                tile = self.map.mget(self.room_x * 16 + tx, self.room_y * 16 + ty)
-                if tile == 1:
-                    print("player spawn at {} {}".format(tx, ty))
-                    obj = PlayerSpawn(self, tx * 8, ty * 8)
-                elif tile == 18:
-                    print("spring")
-                    Spring(self, tx * 8, ty * 8)
-                elif tile == 22:
-                    print("balloon")
-                    Balloon(self, tx * 8, ty * 8)
-                elif tile == 23:
-                    print("fall_floor at {} {}".format(tx, ty))
-                    FallFloor(self, tx * 8, ty * 8)
-                elif tile == 86:
-                    print("message")
-                    Message(self, tx * 8, ty * 8)
-                elif tile == 96:
-                    print("big_chest")
-                    BigChest(self, tx * 8, ty * 8)
-                elif tile == 118:
-                    print("flag")
-                    Flag(self, tx * 8, ty * 8)
-                elif tile == 64:
-                    print("fake_wall")
-                    FakeWall(self, tx * 8, ty * 8)
-                elif k not in self.got_fruit:
-                    if tile  == 26:
-                        print("fruit")
-                        Fruit(self, tx * 8, ty * 8)
-                    elif tile == 28:
-                        print("fly_fruit")
-                        FlyFruit(self, tx * 8, ty * 8)
-                    elif tile == 8:
-                        print("key")
-                        Key(self, tx * 8, ty * 8)
-                    elif tile == 20:
-                        print("chest")
-                        Chest(self, tx * 8, ty * 8)
-                elif tile == 11:
-                    print("platform_1")
-                    p = Platform(self, tx * 8, ty * 8)
-                    p.dir = -1
-                elif tile == 12:
-                    print("platform_2")
-                    p = Platform(self, tx * 8, ty * 8)
-                    p.dir = 1
-    
+        self.registry.clear()
+        for pool in self.pools.values():
+            pool.reset()
+        collected = 1 + self.level_index() in self.got_fruit
+        for cls, tx, ty, attrs, fruit in self.map.spawns(x, y, Game.SPAWNS):
+            if fruit is None or fruit == collected:
+                obj = cls(self, tx, ty)
+                for name, value in attrs:
+                    setattr(obj, name, value)
+        if prof:
+            prof.add('room', prof.clock() - start)
+
     def next_room(self):
         if self.room_x == 7:
             self.load_room(0, self.room_y + 1)
         else:
             self.load_room(self.room_x + 1, self.room_y)
 
+    def snapshot(self):
+        # compact save state of the whole world, see snapshot.py
+        return snapshot.snapshot(self)
+
+    def restore(self, data):
+        snapshot.restore(self, data)
+
     def btn(self, key):
         return self.inputs[key]
 
+    def input_mask(self):
+        mask = 0
+        for i in range(0, len(Game.BUTTONS)):
+            if self.inputs[Game.BUTTONS[i]]:
+                mask |= 1 << i
+        return mask
+
+    def set_input_mask(self, mask):
+        for i in range(0, len(Game.BUTTONS)):
+            self.inputs[Game.BUTTONS[i]] = (mask >> i) & 1 == 1
+
     def appr(self, val, target, amount):
         return max(val - amount, target) if val > target else min(val + amount, target)
         
 
 def main():
-    global SURFACE
+    global STARTED
     pygame.init()
-    G = Game()
-    SURFACE = pygame.display.set_mode((Game.SCREEN_WIDTH, Game.SCREEN_HEIGHT))
+    surface = pygame.display.set_mode((Game.SCREEN_WIDTH, Game.SCREEN_HEIGHT), pygame.RESIZABLE)
     pygame.display.set_caption('Celeste python')
+    recorder = None
+    if '--record' in sys.argv:
+        # replay imports this module
+        from replay import Recorder
+        recorder = Recorder()
+    G = Game(surface, dirty_rects='--dirty' in sys.argv, scaler='smooth' if '--smooth' in sys.argv else 'nearest',
+             seed=recorder.recording.seed if recorder else None, debug=True)
+    if '--rewind' in sys.argv:
+        G.rewind = Rewind()
+    rewinding = False
+    if '--profile' in sys.argv:
+        Profiler(overlay=True).attach(G)
     clock = pygame.time.Clock()
     while True:
         clock.tick(30)
+        if G.profiler:
+            G.profiler.begin_frame()
+            events = G.profiler.clock()
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
+                if G.profiler:
+                    G.profiler.export('profile.csv')
+                if recorder:
+                    recorder.recording.save(sys.argv[sys.argv.index('--record') + 1])
                 pygame.quit()
                 sys.exit()
+            elif event.type == pygame.VIDEORESIZE:
+                G.set_surface(pygame.display.get_surface())
             elif event.type == pygame.KEYDOWN:
-                if event.key == Game.INPUT_LEFT:
+                if event.key == Game.INPUT_REWIND:
+                    rewinding = True
+                elif event.key == Game.INPUT_LEFT:
                     G.inputs['left'] = True
                 elif event.key == Game.INPUT_RIGHT:
                     G.inputs['right'] = True
@@ -397,7 +726,9 @@ def main():
                 elif event.key == Game.INPUT_DASH:
                     G.inputs['dash'] = True
             elif event.type == pygame.KEYUP:
-                if event.key == Game.INPUT_LEFT:
+                if event.key == Game.INPUT_REWIND:
+                    rewinding = False
+                elif event.key == Game.INPUT_LEFT:
                     G.inputs['left'] = False
                 elif event.key == Game.INPUT_RIGHT:
                     G.inputs['right'] = False
@@ -409,13 +740,23 @@ def main():
                     G.inputs['jump'] = False
                 elif event.key == Game.INPUT_DASH:
                     G.inputs['dash'] = False
-        bg_col = Game.COLORS[0]
-        if G.flash_bg:
-            bg_col = Game.COLORS[int(G.frames / 5)]
-        elif G.new_bg:
-            bg_col = Game.COLORS[2]
-        SURFACE.fill(bg_col)
-        G.update()
-        G.render()
-        pygame.display.flip()
-main()
+        if G.profiler:
+            G.profiler.add('events', G.profiler.clock() - events)
+        if rewinding and G.rewind:
+            inputs = dict(G.inputs)
+            if G.rewind.step_back(G) and recorder and recorder.recording.masks:
+                # the frame undone is not part of the run any more
+                recorder.recording.masks.pop()
+            # restore brings back the inputs of that frame, keep the keys held now
+            G.inputs = inputs
+        else:
+            if recorder:
+                recorder.record(G)
+            G.step()
+        G.present()
+        if STARTED is not None:
+            print("first frame after {:.0f} ms".format(1000 * (time.perf_counter() - STARTED)))
+            STARTED = None
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#
+# assets.py
+#
+# Sprite pages shared by every Game in the process. A png is decoded once,
+# scaled if asked, and its pixels kept in .cache/ under the file's hash and
+# the scale, so later launches skip the png decoder. Sprites are source
+# rects into one page surface instead of a surface each:
+#
+#   sprites = assets.atlas('atlas.png', 8, 8)
+#   canvas.blit(sprites.surface, (x, y), sprites.rects[idx])
+#
+import hashlib
+import os
+import struct
+
+import pygame
+
+from map import CACHE_DIR
+
+# width, height of the raw RGBA pixels that follow
+RAW_HEADER = struct.Struct('<II')
+
+atlases = {}
+
+class Atlas:
+    def __init__(self, surface, w, h, rects=None):
+        self.surface = surface
+        self.w = w
+        self.h = h
+        columns = surface.get_width() // w
+        if rects is None:
+            rects = [pygame.Rect((i % columns) * w, (i // columns) * h, w, h)
+                     for i in range(0, columns * (surface.get_height() // h))]
+        self.rects = rects
+        self.variants = {}
+
+    def __len__(self):
+        return len(self.rects)
+
+    def flipped(self, flipX, flipY):
+        # the whole page flipped once, each rect moves to its mirror image
+        key = ('flip', flipX, flipY)
+        atlas = self.variants.get(key)
+        if atlas is None:
+            width, height = self.surface.get_size()
+            rects = [pygame.Rect(width - r.x - r.w if flipX else r.x, height - r.y - r.h if flipY else r.y, r.w, r.h)
+                     for r in self.rects]
+            atlas = Atlas(pygame.transform.flip(self.surface, flipX, flipY), self.w, self.h, rects)
+            self.variants[key] = atlas
+        return atlas
+
+    def tinted(self, color):
+        # the page with every channel clamped to color, for font colors
+        key = ('tint', tuple(color))
+        atlas = self.variants.get(key)
+        if atlas is None:
+            fill = pygame.Surface(self.surface.get_size())
+            fill.fill(color)
+            surface = self.surface.copy()
+            surface.blit(fill, (0, 0), special_flags=pygame.BLEND_MIN)
+            atlas = Atlas(surface, self.w, self.h, self.rects)
+            self.variants[key] = atlas
+        return atlas
+
+def load(path, scale=1):
+    with open(path, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha1(data).hexdigest()[:16]
+    name = '{}-{}-{}.raw'.format(os.path.splitext(os.path.basename(path))[0], digest, scale)
+    cache = os.path.join(CACHE_DIR, name)
+    try:
+        with open(cache, 'rb') as f:
+            raw = f.read()
+        width, height = RAW_HEADER.unpack_from(raw)
+        if len(raw) == RAW_HEADER.size + width * height * 4:
+            return pygame.image.frombytes(raw[RAW_HEADER.size:], (width, height), 'RGBA')
+    except (OSError, struct.error):
+        pass
+
+    surface = pygame.image.load(path)
+    if scale != 1:
+        surface = pygame.transform.scale_by(surface, scale)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        temp = '{}.{}'.format(cache, os.getpid())
+        with open(temp, 'wb') as f:
+            f.write(RAW_HEADER.pack(*surface.get_size()))
+            f.write(pygame.image.tobytes(surface, 'RGBA'))
+        os.replace(temp, cache)
+    except OSError:
+        pass
+    return surface
+
+def atlas(path, w, h, scale=1):
+    key = (path, w, h, scale)
+    if key not in atlases:
+        atlases[key] = Atlas(load(path, scale), w * scale, h * scale)
+    return atlases[key]
@@ -0,0 +1,285 @@
+#
+# batch.py
+#
+# Steps many independent players in one room at once, every field of
+# Player is a numpy array with one entry per run. It mirrors Player.update,
+# ClassicObject.move and Game.solid_at/spikes_at for a room holding only
+# the player, so no springs, balloons, platforms or falling floors. Each
+# run keeps its own freeze counter. A run stops when it dies or leaves the
+# top of the room. The object classes stay the reference, check against
+# them with:
+#
+#   python batch.py --runs 64 --frames 300
+#
+import argparse
+import time
+import random
+
+import numpy as np
+
+from app import Game
+from map import Map
+from objects import Player, PlayerHair, PlayerSpawn
+from replay import random_masks
+
+LEFT, RIGHT, UP, DOWN, JUMP, DASH = [1 << i for i in range(0, len(Game.BUTTONS))]
+HITBOX = Player.HITBOX
+D_HALF = 5 * 0.70710678118
+
+def appr(val, target, amount):
+    return np.where(val > target, np.maximum(val - amount, target), np.minimum(val + amount, target))
+
+def spawn_point(map, rx, ry):
+    for cls, x, y, attrs, fruit in map.spawns(rx, ry, Game.SPAWNS):
+        if cls is PlayerSpawn:
+            return x, y
+    return None
+
+class PlayerBatch:
+    FIELDS = ['x', 'y', 'spd_x', 'spd_y', 'rem_x', 'rem_y', 'djump', 'grace', 'jbuffer', 'dash_time',
+              'dash_effect_time', 'dash_target_x', 'dash_target_y', 'dash_accel_x', 'dash_accel_y']
+
+    def __init__(self, map, rx, ry, n, x, y, max_djump=1):
+        self.n = n
+        self.max_djump = max_djump
+        self.solid = np.array(map.flag_sums(rx, ry)[0])
+        self.spikes = [np.array(sums) for sums in map.spike_sums(rx, ry)]
+        self.level = rx % 8 + ry * 8
+        zeros = lambda: np.zeros(n)
+        for name in PlayerBatch.FIELDS:
+            setattr(self, name, zeros())
+        self.x += x
+        self.y += y
+        self.djump += 1
+        self.p_jump = np.zeros(n, dtype=bool)
+        self.p_dash = np.zeros(n, dtype=bool)
+        self.was_on_ground = np.zeros(n, dtype=bool)
+        self.freeze = np.zeros(n, dtype=int)
+        self.alive = np.ones(n, dtype=bool)
+        self.exited = np.zeros(n, dtype=bool)
+
+    def running(self):
+        return self.alive & ~self.exited
+
+    def corners(self, x, y, w, h):
+        # Game.tile_flag_at's tile range, plus the summed-area indices
+        left = np.maximum(0, np.floor(x / 8)).astype(int)
+        right = np.minimum(15, (x + w - 1) / 8).astype(int)
+        bottom = np.maximum(0, np.floor(y / 8)).astype(int)
+        top = np.minimum(15, (y + h - 1) / 8).astype(int)
+        valid = (left <= right) & (bottom <= top)
+        left = np.clip(left, 0, 16)
+        right = np.clip(right, -1, 15)
+        bottom = np.clip(bottom, 0, 16)
+        top = np.clip(top, -1, 15)
+        return valid, (right + 1 + (top + 1) * 17, right + 1 + bottom * 17, left + (top + 1) * 17, left + bottom * 17)
+
+    def any_in(self, sums, valid, index):
+        a, b, c, d = index
+        return valid & (sums[a] - sums[b] - sums[c] + sums[d] > 0)
+
+    def is_solid(self, x, y, ox, oy):
+        # ClassicObject.is_solid with no objects around is just solid_at
+        hx, hy, hw, hh = HITBOX
+        valid, index = self.corners(x + hx + ox, y + hy + oy, hw, hh)
+        return self.any_in(self.solid, valid, index)
+
+    def spikes_at(self, x, y, w, h, xspd, yspd):
+        valid, index = self.corners(x, y, w, h)
+        up, down, rightward, leftward = self.spikes
+        return ((yspd >= 0) & (np.mod(y + h - 1, 8) >= 6) & self.any_in(up, valid, index)) | \
+               ((yspd <= 0) & (np.mod(y, 8) <= 2) & self.any_in(down, valid, index)) | \
+               ((xspd <= 0) & (np.mod(x, 8) <= 2) & self.any_in(rightward, valid, index)) | \
+               ((xspd >= 0) & (np.mod(x + w - 1, 8) >= 6) & self.any_in(leftward, valid, index))
+
+    def move(self, active):
+        # ClassicObject.move for the active runs, including move_x/move_y
+        # stepping abs(amount) + 1 times
+        self.rem_x = np.where(active, self.rem_x + self.spd_x, self.rem_x)
+        amount = np.where(active, np.floor(self.rem_x + 0.5), 0)
+        self.rem_x -= amount
+        self.step_axis(active, amount, True)
+
+        self.rem_y = np.where(active, self.rem_y + self.spd_y, self.rem_y)
+        amount = np.where(active, np.floor(self.rem_y + 0.5), 0)
+        self.rem_y -= amount
+        self.step_axis(active, amount, False)
+
+    def step_axis(self, active, amount, horizontal):
+        step = np.sign(amount)
+        count = np.abs(amount).astype(int) + 1
+        moving = active.copy()
+        for i in range(0, int(count[active].max()) if active.any() else 0):
+            moving &= i < count
+            if horizontal:
+                blocked = moving & self.is_solid(self.x, self.y, step, 0)
+                self.x = np.where(moving & ~blocked, self.x + step, self.x)
+                self.spd_x[blocked] = 0.0
+                self.rem_x[blocked] = 0.0
+            else:
+                blocked = moving & self.is_solid(self.x, self.y, 0, step)
+                self.y = np.where(moving & ~blocked, self.y + step, self.y)
+                self.spd_y[blocked] = 0.0
+                self.rem_y[blocked] = 0.0
+            moving &= ~blocked
+
+    def step(self, masks):
+        # one Game.step for every run, masks holds each run's input bitmask
+        masks = np.asarray(masks)
+        running = self.running()
+        frozen = running & (self.freeze > 0)
+        self.freeze[frozen] -= 1
+        active = running & ~frozen
+        self.move(active)
+        dead = self.update(active, masks)
+        # Player.draw, skipped for a player killed or gone this frame
+        drawn = running & ~dead & ~self.exited
+        clamp = drawn & ((self.x < -1) | (self.x > 121))
+        self.x = np.where(clamp, np.clip(self.x, -1, 121), self.x)
+        self.spd_x[clamp] = 0.0
+        self.alive &= ~dead
+
+    def update(self, active, masks):
+        btn = lambda bit: (masks & bit) != 0
+        left, right, up, down = btn(LEFT), btn(RIGHT), btn(UP), btn(DOWN)
+        input = np.where(right, 1, np.where(left, -1, 0))
+        hx, hy, hw, hh = HITBOX
+
+        dead = active & self.spikes_at(self.x + hx, self.y + hy, hw, hh, self.spd_x, self.spd_y)
+        dead |= active & (self.y > 128)
+
+        on_ground = self.is_solid(self.x, self.y, 0, 1)
+
+        jump = btn(JUMP) & ~self.p_jump
+        self.p_jump = np.where(active, btn(JUMP), self.p_jump)
+        self.jbuffer = np.where(active & jump, 4, np.where(active & (self.jbuffer > 0), self.jbuffer - 1, self.jbuffer))
+
+        dash = btn(DASH) & ~self.p_dash
+        self.p_dash = np.where(active, btn(DASH), self.p_dash)
+
+        grounded = active & on_ground
+        self.grace = np.where(grounded, 6, np.where(active & ~on_ground & (self.grace > 0), self.grace - 1, self.grace))
+        self.djump = np.where(grounded & (self.djump < self.max_djump), self.max_djump, self.djump)
+
+        self.dash_effect_time -= active
+
+        dashing = active & (self.dash_time > 0)
+        self.dash_time -= dashing
+        self.spd_x = np.where(dashing, appr(self.spd_x, self.dash_target_x, self.dash_accel_x), self.spd_x)
+        self.spd_y = np.where(dashing, appr(self.spd_y, self.dash_target_y, self.dash_accel_y), self.spd_y)
+
+        free = active & ~dashing
+        maxrun = 1
+        accel = np.where(on_ground, 0.6, 0.4)
+        deaccel = 0.15
+        over = np.abs(self.spd_x) > maxrun
+        spd_x = np.where(over, appr(self.spd_x, np.sign(self.spd_x) * maxrun, deaccel), appr(self.spd_x, input * maxrun, accel))
+        self.spd_x = np.where(free, spd_x, self.spd_x)
+
+        gravity = np.where(np.abs(self.spd_y) <= 0.15, 0.21 * 0.5, 0.21)
+        slide = free & ~on_ground & (input != 0) & self.is_solid(self.x, self.y, input, 0)
+        maxfall = np.where(slide, 0.4, 2)
+        self.spd_y = np.where(free & ~on_ground, appr(self.spd_y, maxfall, gravity), self.spd_y)
+
+        buffered = free & (self.jbuffer > 0)
+        jumped = buffered & (self.grace > 0)
+        self.jbuffer[jumped] = 0
+        self.grace[jumped] = 0
+        self.spd_y[jumped] = -2.0
+        walled = buffered & ~jumped
+        wall_dir = np.where(self.is_solid(self.x, self.y, -3, 0), -1, np.where(self.is_solid(self.x, self.y, 3, 0), 1, 0))
+        wall_jump = walled & (wall_dir != 0)
+        self.jbuffer[wall_jump] = 0
+        self.spd_y[wall_jump] = -2.0
+        self.spd_x = np.where(wall_jump, -wall_dir * (maxrun + 1), self.spd_x)
+
+        dashed = free & (self.djump > 0) & dash
+        self.djump -= dashed
+        self.dash_time[dashed] = 4
+        self.dash_effect_time[dashed] = 10
+        dash_x = np.where(left, -1, np.where(right, 1, 0))
+        dash_y = np.where(up, -1, np.where(down, 1, 0))
+        both = (dash_x != 0) & (dash_y != 0)
+        self.spd_x = np.where(dashed, np.where(both, dash_x * D_HALF, np.where(dash_x != 0, dash_x * 5, 0)), self.spd_x)
+        self.spd_y = np.where(dashed, np.where(both, dash_y * D_HALF, np.where(dash_x != 0, 0, dash_y * 5)), self.spd_y)
+        self.freeze[dashed] = 3
+        self.dash_target_x = np.where(dashed, 2 * np.sign(self.spd_x), self.dash_target_x)
+        self.dash_target_y = np.where(dashed, 2 * np.sign(self.spd_y) * np.where(self.spd_y < 0, 0.75, 1), self.dash_target_y)
+        self.dash_accel_x = np.where(dashed, np.where(self.spd_y != 0, 1.5 * 0.70710678118, 1.5), self.dash_accel_x)
+        self.dash_accel_y = np.where(dashed, np.where(self.spd_x != 0, 1.5 * 0.70710678118, 1.5), self.dash_accel_y)
+
+        self.exited |= active & (self.y < -4) & (self.level < 30)
+        self.was_on_ground = np.where(active, on_ground, self.was_on_ground)
+        return dead
+
+    def state(self, i):
+        return {name: getattr(self, name)[i].item() for name in PlayerBatch.FIELDS}
+
+def reference(rx, ry, x, y, max_djump=1):
+    # a game in room rx, ry holding only a player at x, y
+    G = Game(None, seed=0)
+    G.load_room(rx, ry)
+    G.objects.clear()
+    G.registry.clear()
+    for pool in G.pools.values():
+        pool.reset()
+    G.max_djump = max_djump
+    player = Player(G, x, y)
+    player.hair = PlayerHair(G, x, y)
+    return G, player
+
+def parity(rx, ry, masks, max_djump=1):
+    # runs the object classes and the batch on the same (runs, frames)
+    # input masks, returns the (run, frame, field) of every mismatch
+    runs, frames = masks.shape
+    map = Map(None)
+    x, y = spawn_point(map, rx, ry)
+    batch = PlayerBatch(map, rx, ry, runs, x, y, max_djump)
+    games = [reference(rx, ry, x, y, max_djump) for i in range(0, runs)]
+    mismatches = []
+    for f in range(0, frames):
+        running = batch.running()
+        batch.step(masks[:, f])
+        for i in range(0, runs):
+            G, player = games[i]
+            if not running[i]:
+                continue
+            G.set_input_mask(int(masks[i, f]))
+            G.step()
+            if any(obj is player for obj in G.objects) != (batch.alive[i] and not batch.exited[i]):
+                mismatches.append((i, f, 'running'))
+            state = batch.state(i)
+            for name in PlayerBatch.FIELDS:
+                if getattr(player, name) != state[name]:
+                    mismatches.append((i, f, name))
+    return mismatches
+
+def main():
+    parser = argparse.ArgumentParser(description='check the batch player against Player and time it')
+    parser.add_argument('--runs', type=int, default=64)
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--batch', type=int, default=4096, help='runs for the timing')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    map = Map(None)
+    for rx, ry in [(0, 0), (1, 0), (2, 0), (3, 0), (4, 0), (0, 1), (2, 1), (5, 1), (1, 2)]:
+        if spawn_point(map, rx, ry) is None:
+            continue
+        masks = np.array([list(random_masks(rng, args.frames)) for i in range(0, args.runs)], dtype=int)
+        mismatches = parity(rx, ry, masks)
+        print("room {} {}: {} runs x {} frames, {} mismatches{}".format(
+            rx, ry, args.runs, args.frames, len(mismatches), ' first {}'.format(mismatches[0]) if mismatches else ''))
+
+    x, y = spawn_point(map, 0, 0)
+    batch = PlayerBatch(map, 0, 0, args.batch, x, y)
+    masks = np.random.default_rng(args.seed).integers(0, 64, size=args.batch)
+    start = time.perf_counter()
+    for f in range(0, args.frames):
+        batch.step(masks)
+    elapsed = time.perf_counter() - start
+    print("{} runs x {} frames, {:.0f} player steps/s".format(args.batch, args.frames, args.batch * args.frames / elapsed))
+
+if __name__ == '__main__':
+    main()
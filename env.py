@@ -0,0 +1,302 @@
+#
+# env.py
+#
+# Game behind a reset/step interface for agents, in the classic gym shape
+# without depending on gym:
+#
+#   env = Env(observe='pixels', repeat=4)
+#   obs = env.reset(seed=1)
+#   obs, reward, done, info = env.step(action)
+#
+# An action is an index into actions, a list of input masks (every
+# combination of the six buttons by default). Observations are either a
+# float32 state vector (STATE_FIELDS) or the 128x128 canvas as uint8
+# palette indices; the canvas is only drawn for the frame that is
+# returned, the repeated and skipped frames are stepped headless.
+#
+# VecEnv runs N of them in subprocesses. Observations, rewards and dones
+# are written by the workers straight into shared memory arrays, which
+# step() and reset() return without copying; they are overwritten by the
+# next call. An env that is done starts its next episode straight away,
+# the last observation of the old one is in its info as
+# 'terminal_observation':
+#
+#   envs = VecEnv(8, observe='state')
+#   obs = envs.reset(seed=0)
+#   obs, rewards, dones, infos = envs.step(actions)
+#
+import argparse
+import multiprocessing
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pygame
+
+from app import Game
+from objects import Player
+
+STATE_FIELDS = ('room_x', 'room_y', 'alive', 'x', 'y', 'spd_x', 'spd_y', 'flip', 'grace', 'jbuffer', 'djump',
+                'dash_time', 'was_on_ground', 'max_djump', 'has_dashed', 'freeze')
+# reward per room gained, per death, per fruit and per frame
+REWARDS = {'room': 1.0, 'death': -1.0, 'fruit': 1.0, 'frame': 0.0}
+
+class Palette:
+    # turns the canvas pixels back into the indices of Game.COLORS
+    def __init__(self, surface):
+        keys = np.array([surface.map_rgb(color) for color in Game.COLORS], dtype=np.uint32)
+        order = np.argsort(keys)
+        self.keys = keys[order]
+        self.index = order.astype(np.uint8)
+        self.rgb = np.array([(color.r, color.g, color.b) for color in Game.COLORS], dtype=np.int32)
+
+    def indices(self, surface, out):
+        pixels = pygame.surfarray.pixels2d(surface)
+        found = np.minimum(np.searchsorted(self.keys, pixels), len(self.keys) - 1)
+        exact = self.keys[found] == pixels
+        del pixels
+        out[...] = self.index[found].T
+        if not exact.all():
+            # tinted font edges, the closest palette color
+            rgb = pygame.surfarray.pixels3d(surface)[~exact].astype(np.int32)
+            nearest = ((rgb[:, None, :] - self.rgb[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+            out.T[~exact] = nearest
+
+class Env:
+    def __init__(self, observe='state', actions=None, rewards=None, room=(0, 0), repeat=1, skip=0,
+                 max_frames=None, end_on_death=False, out=None):
+        # repeat holds the action for that many frames, skip then steps
+        # that many more with nothing pressed; rewards are summed over all
+        # of them. out is an array to write observations into
+        self.observe = observe
+        self.actions = list(actions) if actions is not None else list(range(0, 1 << len(Game.BUTTONS)))
+        self.rewards = dict(REWARDS, **(rewards or {}))
+        self.room = room
+        self.repeat = max(1, repeat)
+        self.skip = skip
+        self.max_frames = max_frames
+        self.end_on_death = end_on_death
+        if observe == 'pixels':
+            self.shape = (Game.NATIVE_HEIGHT, Game.NATIVE_WIDTH)
+            self.dtype = np.uint8
+            self.surface = pygame.Surface((Game.NATIVE_WIDTH, Game.NATIVE_HEIGHT), 0, 32)
+            self.palette = Palette(self.surface)
+        elif observe == 'state':
+            self.shape = (len(STATE_FIELDS),)
+            self.dtype = np.float32
+            self.surface = None
+        else:
+            raise ValueError("observe must be 'state' or 'pixels', not {!r}".format(observe))
+        self.out = out if out is not None else np.zeros(self.shape, dtype=self.dtype)
+        self.G = None
+        self.episodes = 0
+
+    def reset(self, seed=None):
+        if seed is None:
+            seed = self.episodes
+        self.episodes += 1
+        self.G = Game(self.surface, seed=seed)
+        self.G.load_room(*self.room)
+        if self.surface is not None:
+            # the first observation is drawn without stepping. render() moves
+            # the hair, shake and random state, so those are put back after
+            data = self.G.snapshot()
+            self.G.redraw()
+            self.G.restore(data)
+        self.frames = 0
+        self.level = self.G.level_index()
+        self.deaths = self.G.deaths
+        self.fruit = len(self.G.got_fruit)
+        return self.observation()
+
+    def step(self, action):
+        G = self.G
+        mask = self.actions[action]
+        total = self.repeat + self.skip
+        reward = 0.0
+        done = False
+        # the last frame is drawn, or the one that ends the episode early,
+        # which is only known after its update
+        ends = lambda G: self.ended(self.frames + 1)
+        for i in range(0, total):
+            G.set_input_mask(mask if i < self.repeat else 0)
+            G.step(self.surface is not None and (i == total - 1 or ends))
+            self.frames += 1
+            reward += self.reward()
+            done = self.ended(self.frames)
+            if done:
+                break
+        info = {'frames': self.frames, 'room': (G.room_x, G.room_y), 'deaths': G.deaths, 'fruit': len(G.got_fruit)}
+        return self.observation(), reward, done, info
+
+    def ended(self, frames):
+        return (self.end_on_death and self.G.deaths > 0) or (self.max_frames is not None and frames >= self.max_frames)
+
+    def reward(self):
+        # what changed since the last frame, weighted by self.rewards
+        G = self.G
+        level = G.level_index()
+        fruit = len(G.got_fruit)
+        reward = (self.rewards['room'] * max(0, level - self.level) + self.rewards['death'] * (G.deaths - self.deaths) +
+                  self.rewards['fruit'] * (fruit - self.fruit) + self.rewards['frame'])
+        self.level = level
+        self.deaths = G.deaths
+        self.fruit = fruit
+        return reward
+
+    def observation(self):
+        if self.surface is not None:
+            self.palette.indices(self.surface, self.out)
+        else:
+            self.out[...] = self.state()
+        return self.out
+
+    def state(self):
+        G = self.G
+        player = next((obj for obj in G.objects if type(obj) is Player), None)
+        values = [G.room_x, G.room_y, player is not None]
+        if player is not None:
+            values += [player.x, player.y, player.spd_x, player.spd_y, player.flipX, player.grace, player.jbuffer,
+                       player.djump, player.dash_time, player.was_on_ground]
+        else:
+            values += [0] * 10
+        return values + [G.max_djump, G.has_dashed, G.freeze]
+
+def worker(conn, index, names, shapes, kwargs):
+    blocks = [shared_memory.SharedMemory(name) for name in names]
+    obs, rewards, dones, actions = [np.ndarray(shape, dtype=dtype, buffer=block.buf)
+                                    for block, (shape, dtype) in zip(blocks, shapes)]
+    env = Env(out=obs[index], **kwargs)
+    while True:
+        command, value = conn.recv()
+        if command == 'reset':
+            env.reset(value)
+            conn.send(None)
+        elif command == 'step':
+            observation, rewards[index], dones[index], info = env.step(actions[index])
+            if dones[index]:
+                # the next episode starts right away, like gym's vector envs,
+                # so its first observation replaces the last one of this
+                info['terminal_observation'] = observation.copy()
+                env.reset()
+            conn.send(info)
+        else:
+            break
+    del obs, rewards, dones, actions
+    for block in blocks:
+        block.close()
+    conn.close()
+
+class VecEnv:
+    def __init__(self, n, **kwargs):
+        probe = Env(**kwargs)
+        self.n = n
+        self.shape = probe.shape
+        self.dtype = probe.dtype
+        self.actions = probe.actions
+        shapes = [((n,) + probe.shape, probe.dtype), ((n,), np.float32), ((n,), np.bool_), ((n,), np.int64)]
+        # workers share the parent's tracker, so they do not unlink the
+        # blocks when they exit
+        resource_tracker.ensure_running()
+        self.blocks = [shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize))
+                       for shape, dtype in shapes]
+        self.obs, self.rewards, self.dones, self.action_buffer = [
+            np.ndarray(shape, dtype=dtype, buffer=block.buf) for block, (shape, dtype) in zip(self.blocks, shapes)]
+        names = [block.name for block in self.blocks]
+        self.conns = []
+        self.processes = []
+        for i in range(0, n):
+            conn, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=worker, args=(child, i, names, shapes, kwargs), daemon=True)
+            process.start()
+            child.close()
+            self.conns.append(conn)
+            self.processes.append(process)
+
+    def __len__(self):
+        return self.n
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def reset(self, seed=None):
+        # env i gets seed + i
+        for i, conn in enumerate(self.conns):
+            conn.send(('reset', None if seed is None else seed + i))
+        for conn in self.conns:
+            conn.recv()
+        return self.obs
+
+    def step(self, actions):
+        self.action_buffer[:] = actions
+        for conn in self.conns:
+            conn.send(('step', None))
+        infos = [conn.recv() for conn in self.conns]
+        return self.obs, self.rewards, self.dones, infos
+
+    def close(self):
+        if not self.processes:
+            return
+        for conn in self.conns:
+            conn.send(('close', None))
+        for process in self.processes:
+            process.join()
+        self.processes = []
+        del self.obs, self.rewards, self.dones, self.action_buffer
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+
+def main():
+    parser = argparse.ArgumentParser(description='time the environments and check VecEnv against Env')
+    parser.add_argument('--envs', type=int, default=4)
+    parser.add_argument('--steps', type=int, default=500)
+    parser.add_argument('--observe', choices=['state', 'pixels'], default='state')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--skip', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    kwargs = dict(observe=args.observe, repeat=args.repeat, skip=args.skip, max_frames=900)
+    actions = np.random.default_rng(args.seed).integers(0, 64, size=(args.steps, args.envs))
+
+    # the same autoreset rule as VecEnv
+    envs = [Env(**kwargs) for i in range(0, args.envs)]
+    expected = []
+    terminal = {}
+    start = time.perf_counter()
+    for i, env in enumerate(envs):
+        env.reset(args.seed + i)
+    for step in range(0, args.steps):
+        frame = []
+        for i, env in enumerate(envs):
+            obs, reward, done, info = env.step(actions[step, i])
+            if done:
+                terminal[(step, i)] = obs.copy()
+                obs = env.reset()
+            frame.append(obs.copy())
+        expected.append(frame)
+    elapsed = time.perf_counter() - start
+    print("Env    {} x {} steps, {:.0f} steps/s".format(args.envs, args.steps, args.envs * args.steps / elapsed))
+
+    with VecEnv(args.envs, **kwargs) as vec:
+        mismatches = 0
+        start = time.perf_counter()
+        vec.reset(args.seed)
+        for step in range(0, args.steps):
+            obs, rewards, dones, infos = vec.step(actions[step])
+            for i in range(0, args.envs):
+                if not np.array_equal(obs[i], expected[step][i]):
+                    mismatches += 1
+                if ('terminal_observation' in infos[i]) != ((step, i) in terminal) or \
+                        dones[i] and not np.array_equal(infos[i]['terminal_observation'], terminal[(step, i)]):
+                    mismatches += 1
+        elapsed = time.perf_counter() - start
+    print("VecEnv {} x {} steps, {:.0f} steps/s, {} episodes ended, {} observations differ".format(
+        args.envs, args.steps, args.envs * args.steps / elapsed, len(terminal), mismatches))
+
+if __name__ == '__main__':
+    main()
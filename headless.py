@@ -0,0 +1,90 @@
+#
+# headless.py
+#
+# Steps the game without a window or frame clock, e.g. on display-less
+# boxes for batch testing and bots:
+#
+#   python headless.py --frames 3000 --render
+#
+# --parity checks the swept movement resolver against the stepping loop
+# in every room, see parity().
+#
+import argparse
+import random
+import time
+import pygame
+
+from app import Game
+from profiler import Profiler
+from replay import random_masks
+
+def press_start(G, frame):
+    # hold jump for the first few frames to leave the title screen
+    G.inputs['jump'] = frame < 3
+
+def run(frames, render=False, inputs=None, swept=False, profiler=None):
+    surface = pygame.Surface((Game.SCREEN_WIDTH, Game.SCREEN_HEIGHT)) if render else None
+    G = Game(surface)
+    G.swept = swept
+    if profiler:
+        profiler.attach(G)
+    start = time.perf_counter()
+    for i in range(0, frames):
+        if inputs:
+            inputs(G, i)
+        G.step()
+        if profiler:
+            profiler.end_frame(G)
+    elapsed = time.perf_counter() - start
+    return G, frames / elapsed if elapsed > 0 else float('inf')
+
+def parity(frames, seed=1, runs=2):
+    # steps a stepping and a swept game side by side from every room with
+    # the same seed and inputs, returns the (room, run, frame) of every
+    # frame their snapshots differ
+    mismatches = []
+    rng = random.Random(seed)
+    for ry in range(0, 4):
+        for rx in range(0, 8):
+            for run in range(0, runs):
+                games = []
+                for swept in (False, True):
+                    G = Game(None, seed=seed)
+                    G.swept = swept
+                    G.load_room(rx, ry)
+                    games.append(G)
+                masks = random_masks(rng, frames)
+                for f in range(0, frames):
+                    for G in games:
+                        G.set_input_mask(masks[f])
+                        G.step()
+                    if games[0].snapshot() != games[1].snapshot():
+                        mismatches.append(((rx, ry), run, f))
+                        break
+    return mismatches
+
+def main():
+    parser = argparse.ArgumentParser(description='run celeste without a display')
+    parser.add_argument('--frames', type=int, default=3000)
+    parser.add_argument('--render', action='store_true', help='draw every frame to an offscreen surface')
+    parser.add_argument('--swept', action='store_true', help='use the swept movement resolver')
+    parser.add_argument('--profile', metavar='PATH', help='write per-frame timings to a .csv or .json file')
+    parser.add_argument('--title', action='store_true', help='stay on the title screen')
+    parser.add_argument('--parity', action='store_true', help='check --swept against the stepping loop in every room')
+    args = parser.parse_args()
+
+    if args.parity:
+        mismatches = parity(args.frames)
+        print("{} mismatches{}".format(len(mismatches), ' first {}'.format(mismatches[0]) if mismatches else ''))
+        return
+
+    profiler = Profiler(size=args.frames) if args.profile else None
+    G, sps = run(args.frames, args.render, None if args.title else press_start, args.swept, profiler)
+    print("{} frames, room {} {}, {:.1f} steps/s".format(args.frames, G.room_x, G.room_y, sps))
+    if profiler:
+        profiler.export(args.profile)
+        for phase, ms in profiler.summary().items():
+            print("  {:<10} {:.3f} ms".format(phase, ms))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#
+# host.py
+#
+# Runs many independent games in one process, stepped round-robin. Each
+# Game has its own random state, inputs and render target (an offscreen
+# surface or none at all); sprite pages, the compiled map and the room
+# layers are loaded once and shared by all of them:
+#
+#   python host.py --games 200 --frames 300 --render 10
+#
+import argparse
+import random
+import time
+import tracemalloc
+import pygame
+
+from app import Game
+from replay import random_mask
+
+class RandomInputs:
+    # random buttons, each combination held for a few frames
+    def __init__(self, seed=None, hold=4):
+        self.rng = random.Random(seed)
+        self.hold = hold
+        self.mask = 0
+        self.left = 0
+
+    def __call__(self, G):
+        if self.left <= 0:
+            self.mask = random_mask(self.rng)
+            self.left = self.hold
+        self.left -= 1
+        G.set_input_mask(self.mask)
+
+class MaskInputs:
+    # a recorded list of input masks, one per step, then nothing pressed
+    def __init__(self, masks):
+        self.masks = masks
+        self.index = 0
+
+    def __call__(self, G):
+        G.set_input_mask(self.masks[self.index] if self.index < len(self.masks) else 0)
+        self.index += 1
+
+class Host:
+    def __init__(self):
+        self.games = []
+
+    def __len__(self):
+        return len(self.games)
+
+    def add(self, surface=None, seed=None, inputs=None, swept=False):
+        G = Game(surface, seed=seed)
+        G.swept = swept
+        G.input_source = inputs
+        self.games.append(G)
+        return G
+
+    def remove(self, G):
+        self.games.remove(G)
+
+    def step(self):
+        # one frame of every game in turn
+        for G in self.games:
+            G.step()
+
+    def run(self, frames):
+        for i in range(0, frames):
+            self.step()
+
+def main():
+    parser = argparse.ArgumentParser(description='host many celeste games in one process')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--render', type=int, default=0, metavar='N', help='give the first N games an offscreen surface')
+    parser.add_argument('--swept', action='store_true', help='use the swept movement resolver')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    host = Host()
+    for i in range(0, args.games):
+        surface = pygame.Surface((Game.NATIVE_WIDTH, Game.NATIVE_HEIGHT)) if i < args.render else None
+        host.add(surface, seed=args.seed + i, inputs=RandomInputs(args.seed + i), swept=args.swept)
+    memory = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    host.run(args.frames)
+    elapsed = time.perf_counter() - start
+    steps = args.games * args.frames
+    rooms = len({(G.room_x, G.room_y) for G in host.games})
+    print("{} games x {} frames, {} rooms, {:.1f} steps/s, {:.1f} kb python heap per game".format(
+        args.games, args.frames, rooms, steps / elapsed if elapsed > 0 else float('inf'), memory / 1024 / args.games))
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,15 @@
+#
+# map.py
+#
+# The tilemap is compiled from MapData once into a flat byte string of tile
+# numbers and kept in .cache/, named after a hash of MapData so edits to it
+# recompile. Later launches map that file instead of parsing the hex.
+#
+import hashlib
+import mmap
+import os
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
 
 class Map:
     MapData = """2331252548252532323232323300002425262425252631323232252628282824252525252525323328382828312525253232323233000000313232323232323232330000002432323233313232322525252525482525252525252526282824252548252525262828282824254825252526282828283132323225482525252525
@@ -108,19 +120,52 @@ b302b211000000110092b100000000a3b1b1b1b1b1b10011111232110000b342000000a282125284
             0, 0, 19, 19, 19, 19, 0, 0, 0, 2, 2, 2, 2, 2, 2, 2
             ]
 
+    # spike tiles pointing up, down, right and left
+    SPIKES = [17, 27, 43, 59]
+
+    # the bottom half of MapData stores each byte low nibble first
+    SWAP = bytes(((b & 15) << 4) | (b >> 4) for b in range(0, 256))
+
+    # tilemap and flag tables are read only, so every Game shares them
+    tiles = None
+    tables = {}
+
     def __init__(self, G):
-        self.tilemap = []
         self.G = G
-        tile_data = Map.MapData
-        tile_data = tile_data.replace('\n', '')
-        hlen = len(tile_data) / 2
-        print(len(tile_data))
-        for i in range(0, len(tile_data), 2):
-            a = tile_data[i]
-            b = tile_data[i + 1]
-            tile_str =  (str(a) + str(b)) if i < hlen else (str(b) + str(a))
-            self.tilemap.append(int(tile_str, 16))
+        if Map.tiles is None:
+            Map.tiles = Map.load()
+        self.tilemap = Map.tiles
+        self.flag_tables = Map.tables
+
+    @staticmethod
+    def compile(data):
+        data = bytes.fromhex(data.replace('\n', ''))
+        half = len(data) // 2
+        return data[:half] + data[half:].translate(Map.SWAP)
 
+    @staticmethod
+    def load():
+        digest = hashlib.sha1(Map.MapData.encode()).hexdigest()[:16]
+        path = os.path.join(CACHE_DIR, 'map-{}.bin'.format(digest))
+        try:
+            with open(path, 'rb') as f:
+                tiles = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if len(tiles) == 128 * 64:
+                return tiles
+            tiles.close()
+        except (OSError, ValueError):
+            pass
+        tiles = Map.compile(Map.MapData)
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            temp = '{}.{}'.format(path, os.getpid())
+            with open(temp, 'wb') as f:
+                f.write(tiles)
+            os.replace(temp, path)
+        except OSError:
+            # read only checkout, keep the compiled map in memory
+            pass
+        return tiles
 
     def mget(self, tx, ty):
         return self.tilemap[tx + ty * 128]
@@ -129,6 +174,54 @@ b302b211000000110092b100000000a3b1b1b1b1b1b10011111232110000b342000000a282125284
         return tile < len(Map.Mask) and (Map.Mask[tile] & (1 << flag)) != 0
 
 
+    def sums(self, rx, ry, test):
+        # summed-area table of the room's 16x16 tiles passing test, so any
+        # rectangle of tiles can be checked in constant time. entry (i, j)
+        # lives at i + j * 17 and counts tiles left of i, above j.
+        sums = [0] * (17 * 17)
+        for j in range(0, 16):
+            row = 0
+            for i in range(0, 16):
+                if test(self.mget(rx * 16 + i, ry * 16 + j)):
+                    row += 1
+                sums[(i + 1) + (j + 1) * 17] = sums[(i + 1) + j * 17] + row
+        return sums
+
+    def flag_sums(self, rx, ry):
+        # one table per flag
+        key = (rx, ry)
+        if key not in self.flag_tables:
+            self.flag_tables[key] = [self.sums(rx, ry, lambda tile, flag=flag: self.fget(tile, flag))
+                                     for flag in range(0, 8)]
+        return self.flag_tables[key]
+
+    def spike_sums(self, rx, ry):
+        # one table per tile in SPIKES
+        key = (rx, ry, 'spikes')
+        if key not in self.flag_tables:
+            self.flag_tables[key] = [self.sums(rx, ry, lambda tile, spike=spike: tile == spike)
+                                     for spike in Map.SPIKES]
+        return self.flag_tables[key]
+
+    def spawns(self, rx, ry, table):
+        # (class, x, y, attributes, fruit) for each tile of the room found in
+        # table (see Game.SPAWNS), in the order load_room has always spawned.
+        # cached per table; the entry keeps the table alive so its id is not
+        # reused by another one
+        key = (rx, ry, 'spawns', id(table))
+        entry = self.flag_tables.get(key)
+        if entry is None:
+            manifest = []
+            for tx in range(0, 16):
+                for ty in range(0, 16):
+                    spawn = table.get(self.mget(rx * 16 + tx, ry * 16 + ty))
+                    if spawn is not None:
+                        cls, attrs, fruit = spawn
+                        manifest.append((cls, tx * 8, ty * 8, attrs, fruit))
+            entry = (table, manifest)
+            self.flag_tables[key] = entry
+        return entry[1]
+
     def draw(self, mx, my, tx, ty, mw, mh, mask = 0):
         for x in range(0, mw):
             for y in range(0, mh):
@@ -1,8 +1,18 @@
-import pygame
 import math
-import random
+from array import array
+import numpy as np
+
+from registry import ObjectRegistry
+from particles import Particles
 
 class ClassicObject:
+    # objects are slotted and keep speed and remainder as plain floats, so
+    # moving allocates nothing. hitbox is an (x, y, w, h) tuple shared by
+    # every object of a class unless an object assigns its own
+    __slots__ = ('G', 'type', 'spr', 'flipX', 'flipY', 'solids', 'collideable', 'slot', 'cell', 'serial', '_x', '_y',
+                 'hitbox', 'spd_x', 'spd_y', 'rem_x', 'rem_y')
+    HITBOX = (0, 0, 8, 8)
+
     def __init__(self, game, x, y, tile=0) -> None:
         self.G = game
         self.type = 0
@@ -11,29 +21,61 @@ class ClassicObject:
         self.flipY = False
         self.solids = True
         self.collideable = True
+        # index in Game.objects, None while not in it
+        self.slot = None
+        # grid cell in the game's registry, None while not registered
+        self.cell = None
+        self.serial = 0
         self.x = x
         self.y = y
-        self.hitbox = pygame.Rect(0, 0, 8, 8)
-        self.spd = pygame.Vector2(0, 0)
-        self.rem = pygame.Vector2(0, 0)
+        self.hitbox = type(self).HITBOX
+        self.spd_x = 0.0
+        self.spd_y = 0.0
+        self.rem_x = 0.0
+        self.rem_y = 0.0
+
+    @property
+    def x(self):
+        return self._x
+
+    @x.setter
+    def x(self, value):
+        self._x = value
+        if self.cell is not None:
+            cx = int(value // ObjectRegistry.CELL)
+            if cx != self.cell[0]:
+                self.G.registry.moved(self, (cx, self.cell[1]))
+
+    @property
+    def y(self):
+        return self._y
+
+    @y.setter
+    def y(self, value):
+        self._y = value
+        if self.cell is not None:
+            cy = int(value // ObjectRegistry.CELL)
+            if cy != self.cell[1]:
+                self.G.registry.moved(self, (self.cell[0], cy))
 
     def is_solid(self, ox, oy):
         if oy > 0 and not self.check(Platform, ox, 0) and self.check(Platform, ox, oy):
             return True
-        solid = self.G.solid_at(self.x + self.hitbox.x + ox, self.y + self.hitbox.y + oy, self.hitbox.w, self.hitbox.h) or \
+        hx, hy, hw, hh = self.hitbox
+        solid = self.G.solid_at(self.x + hx + ox, self.y + hy + oy, hw, hh) or \
                 self.check(FallFloor, ox, oy) or self.check(FakeWall, ox, oy)
         #print(solid)
         return solid
 
     def move(self, ox, oy):
-        self.rem.x += ox
-        amount = math.floor(self.rem.x + 0.5)
-        self.rem.x -= amount
+        self.rem_x += ox
+        amount = math.floor(self.rem_x + 0.5)
+        self.rem_x -= amount
         self.move_x(amount, 0)
 
-        self.rem.y += oy
-        amount = math.floor(self.rem.y + 0.5)
-        self.rem.y -= amount
+        self.rem_y += oy
+        amount = math.floor(self.rem_y + 0.5)
+        self.rem_y -= amount
         self.move_y(amount)
 
     def sign(self, n):
@@ -43,35 +85,133 @@ class ClassicObject:
         return max(a, min(b, val))
     
     def maybe(self):
-        return random.random() < 0.5
+        return self.G.rng.random() < 0.5
 
     def move_x(self, amount, start):
-        if self.solids:
+        if self.solids and self.G.swept:
+            self.sweep_x(amount, start)
+        elif self.solids:
             step = self.sign(amount)
             for i in range(start, int(abs(amount)) + 1):
                 if not self.is_solid(step, 0):
                     self.x += step
                 else:
-                    self.spd.x = 0
-                    self.rem.x = 0
+                    self.spd_x = 0.0
+                    self.rem_x = 0.0
                     break
         else:
             self.x += amount
             
 
     def move_y(self, amount):
-        if self.solids:
+        if self.solids and self.G.swept:
+            self.sweep_y(amount)
+        elif self.solids:
             step = self.sign(amount)
             for i in range(0, int(abs(amount)) + 1):
                 if not self.is_solid(0, step):
                     self.y += step
                 else:
-                    self.spd.y = 0
-                    self.rem.y = 0
+                    self.spd_y = 0.0
+                    self.rem_y = 0.0
                     break
         else:
             self.y += amount
 
+    def solids_along(self, x, y, w, h):
+        registry = self.G.registry
+        return [obj for ty in (FallFloor, FakeWall) for obj in registry.near(ty, x, y, w, h) if obj is not self]
+
+    def platforms_along(self, x, y, w, h):
+        return [obj for obj in self.G.registry.near(Platform, x, y, w, h) if obj is not self]
+
+    def sweep_x(self, amount, start):
+        # same positions and zeroing as the stepping loop in move_x, but the
+        # tiles and solid objects along the whole path are looked up once;
+        # the tiles are only checked per pixel when the path has a solid one
+        step = self.sign(amount)
+        count = int(abs(amount)) + 1 - start
+        if count <= 0:
+            return
+        if step == 0:
+            if self.is_solid(0, 0):
+                self.spd_x = 0.0
+                self.rem_x = 0.0
+            return
+
+        hb = self.hitbox
+        hx, hy, hw, hh = hb
+        x = self.x
+        y = self.y
+        overlaps = self.G.registry.overlaps
+        solids = self.solids_along(min(x, x + step * count) + hx - 1, y + hy - 1, hw + count + 2, hh + 2)
+        tiles = self.G.solid_at(min(x + step, x + step * count) + hx, y + hy, hw + count - 1, hh)
+        for i in range(0, count):
+            blocked = tiles and self.G.solid_at(x + hx + step, y + hy, hw, hh)
+            if not blocked:
+                for obj in solids:
+                    if obj.collideable and overlaps(obj, x, y, hb, step, 0):
+                        blocked = True
+                        break
+            if blocked:
+                self.spd_x = 0.0
+                self.rem_x = 0.0
+                break
+            x += step
+        self.x = x
+
+    def sweep_y(self, amount):
+        # move_y counterpart of sweep_x, including the one way platform rule
+        # is_solid applies when moving down
+        step = self.sign(amount)
+        count = int(abs(amount)) + 1
+        if step == 0:
+            if self.is_solid(0, 0):
+                self.spd_y = 0.0
+                self.rem_y = 0.0
+            return
+
+        hb = self.hitbox
+        hx, hy, hw, hh = hb
+        x = self.x
+        y = self.y
+        overlaps = self.G.registry.overlaps
+        top = min(y, y + step * count) + hy - 1
+        solids = self.solids_along(x + hx - 1, top, hw + 2, hh + count + 2)
+        platforms = self.platforms_along(x + hx - 1, top, hw + 2, hh + count + 2) if step > 0 else ()
+        tiles = self.G.solid_at(x + hx, min(y + step, y + step * count) + hy, hw, hh + count - 1)
+        for i in range(0, count):
+            blocked = False
+            if platforms:
+                on = False
+                below = False
+                for obj in platforms:
+                    if obj.collideable:
+                        on = on or overlaps(obj, x, y, hb, 0, 0)
+                        below = below or overlaps(obj, x, y, hb, 0, step)
+                blocked = below and not on
+            if not blocked and tiles:
+                blocked = self.G.solid_at(x + hx, y + hy + step, hw, hh)
+            if not blocked:
+                for obj in solids:
+                    if obj.collideable and overlaps(obj, x, y, hb, 0, step):
+                        blocked = True
+                        break
+            if blocked:
+                self.spd_y = 0.0
+                self.rem_y = 0.0
+                break
+            y += step
+        self.y = y
+
+    @classmethod
+    def spawn(cls, game, x, y):
+        # Smoke and Lifeup come from the game's pools, see pool.py
+        obj = game.pools[cls].acquire(game)
+        if obj is not None:
+            obj.__init__(game, x, y)
+        return obj
+
     def update(self):
         pass
 
@@ -80,82 +220,75 @@ class ClassicObject:
             self.G.draw_spr(self.spr, self.x, self.y, 1, 1, self.flipX, self.flipY)
 
     def collide(self, ty, ox, oy):
-        for obj in self.G.objects:
-            if obj and type(obj) == ty and self != obj and obj.collideable and \
-                obj.x + obj.hitbox.x + obj.hitbox.w > self.x + self.hitbox.x + ox and \
-                obj.y + obj.hitbox.y + obj.hitbox.h > self.y + self.hitbox.y + oy and \
-                obj.x + obj.hitbox.x < self.x + self.hitbox.x + self.hitbox.w + ox and \
-                obj.y + obj.hitbox.y < self.y + self.hitbox.y + self.hitbox.h + oy:
-                return obj
-        return None
+        return self.G.registry.first(ty, self, ox, oy)
                 
     def check(self, ty, ox, oy):
         return self.collide(ty, ox, oy) != None
 
 class PlayerHair(ClassicObject):
-    class Node:
-        def __init__(self) -> None:
-            self.x = 0
-            self.y = 0
-            self.size = 0
+    __slots__ = ('hair',)
+    SIZES = (2, 2, 1, 1, 1)
 
     def __init__(self, game, x, y, tile=0) -> None:
         super().__init__(game, x, y, tile)
-        self.hair = []
-        for i in range(0, 5):
-            node = PlayerHair.Node()
-            node.x = x
-            node.y = y
-            node.size = max(1, min(2, 3 - i))
-            self.hair.append(node)
+        # x, y of each node, sizes are in SIZES
+        self.hair = array('d', [x, y] * len(PlayerHair.SIZES))
 
     def draw_hair(self, obj, facing, djump):
         c = 8 if djump == 1 else (7 + math.floor((self.G.frames / 3) % 2) * 4) if djump == 2 else 12
-        last = pygame.Vector2(obj.x + 4 - facing * 2, obj.y + 3)
-        for h in self.hair:
-            h.x += (last.x - h.x) / 1.5
-            h.y += (last.y + 0.5 - h.y) / 1.5
-            self.G.draw_circfill(h.x, h.y, h.size, c)
-            last = pygame.Vector2(h.x, h.y)
-            
+        last_x = obj.x + 4 - facing * 2
+        last_y = obj.y + 3
+        hair = self.hair
+        for i in range(0, len(PlayerHair.SIZES)):
+            hair[2 * i] += (last_x - hair[2 * i]) / 1.5
+            hair[2 * i + 1] += (last_y + 0.5 - hair[2 * i + 1]) / 1.5
+            last_x = hair[2 * i]
+            last_y = hair[2 * i + 1]
+            self.G.draw_circfill(last_x, last_y, PlayerHair.SIZES[i], c)
+
 
 class PlayerSpawn(ClassicObject):
+    __slots__ = ('target_x', 'target_y', 'state', 'delay', 'hair')
+
     def __init__(self, game, x, y, tile=0) -> None:
         super().__init__(game, x, y, tile)
         self.spr = 3
-        self.spd.y = -4
-        self.target = pygame.Vector2(x, y)
+        self.spd_y = -4.0
+        self.target_x = float(x)
+        self.target_y = float(y)
         self.y = 128
         self.state = 0
         self.solids = False
         self.delay = 0
         self.hair = PlayerHair(game, self.x, self.y)
-        self.G.objects.append(self)
+        self.G.add_object(self)
 
     def update(self):
         # jumping up
         if self.state == 0:
-            if self.y < self.target.y + 16:
+            if self.y < self.target_y + 16:
                 self.state = 1
                 self.delay = 3
         # falling
         elif self.state == 1:
-            self.spd.y += 0.5
-            if self.spd.y > 0 and self.delay > 0:
-                self.spd.y = 0
+            self.spd_y += 0.5
+            if self.spd_y > 0 and self.delay > 0:
+                self.spd_y = 0.0
                 self.delay -= 1
-            if self.spd.y > 0 and self.y > self.target.y:
-                self.y = self.target.y
-                self.spd = pygame.Vector2(0, 0)
+            if self.spd_y > 0 and self.y > self.target_y:
+                self.y = self.target_y
+                self.spd_x = 0.0
+                self.spd_y = 0.0
                 self.state = 2
                 self.delay = 5
                 self.G.shake = 5
-                Smoke(self.G, self.x, self.y + 4)
+                Smoke.spawn(self.G, self.x, self.y + 4)
         elif self.state == 2:
             self.delay -= 1
             self.spr = 6
             if self.delay < 0:
-                print("Init player...")
+                if self.G.debug:
+                    print("Init player...")
                 self.G.destroy_object(self)
                 player = Player(self.G, self.x, self.y)
                 player.hair = self.hair
@@ -166,14 +299,16 @@ class PlayerSpawn(ClassicObject):
         super().draw()
 
 class Smoke(ClassicObject):
+    __slots__ = ()
+
     def __init__(self, game, x, y, tile=0) -> None:
         super().__init__(game, x, y, tile)
-        game.objects.append(self)
+        game.add_object(self)
         self.spr = 29
-        self.spd.y = -0.1
-        self.spd.x = 0.3 + (random.random() % 0.2)
-        self.x += -1 + random.randint(0, 2)
-        self.y += -1 + random.randint(0, 2)
+        self.spd_y = -0.1
+        self.spd_x = 0.3 + (self.G.rng.random() % 0.2)
+        self.x += -1 + self.G.rng.randint(0, 2)
+        self.y += -1 + self.G.rng.randint(0, 2)
         self.flipX = self.maybe()
         self.flipY = self.maybe()
     
@@ -183,9 +318,13 @@ class Smoke(ClassicObject):
             self.G.destroy_object(self)
 
 class FakeWall(ClassicObject):
+    __slots__ = ()
+    REACH = (-1, -1, 18, 18)
+    SOLID = (0, 0, 16, 16)
+
     def __init__(self, game, x, y, tile=0) -> None:
         super().__init__(game, x, y, tile)
-        game.objects.append(self)
+        game.add_object(self)
     
     def update(self):
         pass
@@ -200,7 +339,7 @@ def break_fall_floor(obj):
     if obj.state == 0:
         obj.state = 1
         obj.delay = 15
-        Smoke(obj.G, obj.x, obj.y)
+        Smoke.spawn(obj.G, obj.x, obj.y)
         hit = obj.collide(Spring, 0, -1)
         if hit:
             break_spring(hit)
@@ -209,9 +348,11 @@ def break_spring(obj):
     obj.hide_in = 15
 
 class FallFloor(ClassicObject):
+    __slots__ = ('state', 'solid', 'delay')
+
     def __init__(self, game, x, y, tile=0) -> None:
         super().__init__(game, x, y, tile)
-        game.objects.append(self)
+        game.add_object(self)
         self.state = 0
         self.solid = True
         self.delay = 0
@@ -231,7 +372,7 @@ class FallFloor(ClassicObject):
             if self.delay <= 0 and self.check(Player, 0, 0):
                 self.state = 0
                 self.collideable = True
-                Smoke(self.G, self.x, self.y)
+                Smoke.spawn(self.G, self.x, self.y)
             
 
     def draw(self):
@@ -242,9 +383,11 @@ class FallFloor(ClassicObject):
                 self.G.draw_spr(23 + int((15 - self.delay) / 5), self.x, self.y)
 
 class Fruit(ClassicObject):
+    __slots__ = ('start', 'off')
+
     def __init__(self, game, x, y, tile=0) -> None:
         super().__init__(game, x, y, tile)
-        game.objects.append(self)
+        game.add_object(self)
         self.spr = 26
         self.start = y
         self.off = 0
@@ -253,16 +396,18 @@ class Fruit(ClassicObject):
         hit = self.collide(Player, 0, 0)
         if hit:
             hit.djump = self.G.max_djump
-            self.G.got_fruit[1 + self.G.level_index] = 1
-            Lifeup(self.G, self.x, self.y)
+            self.G.got_fruit[1 + self.G.level_index()] = 1
+            Lifeup.spawn(self.G, self.x, self.y)
             self.G.destroy_object(self)
         self.off += 1
         self.y = self.start + math.sin(self.off / 40.0) * 2.5
 
 class FlyFruit(ClassicObject):
+    __slots__ = ('start', 'fly', 'step')
+
     def __init__(self, game, x, y, tile=0) -> None:
         super().__init__(game, x, y, tile)
-        game.objects.append(self)
+        game.add_object(self)
         self.start = y
         self.fly = False
         self.step = 0.5
@@ -271,20 +416,20 @@ class FlyFruit(ClassicObject):
     
     def update(self):
         if self.fly:
-            self.spd.y = self.G.appr(self.spd.y, -3.5, 0.25)
+            self.spd_y = self.G.appr(self.spd_y, -3.5, 0.25)
             if self.y < -16:
                 self.G.destroy_object(self)
         else:
             if self.G.has_dashed:
                 self.fly = True
             self.step += 0.05
-            self.spd.y = math.sin(self.step) * 0.5
+            self.spd_y = math.sin(self.step) * 0.5
 
         hit = self.collide(Player, 0, 0)
         if hit:
             hit.djump = self.G.max_djump
-            self.G.got_fruit[1 + self.G.level_index] = 1
-            Lifeup(self.G, self.x, self.y)
+            self.G.got_fruit[1 + self.G.level_index()] = 1
+            Lifeup.spawn(self.G, self.x, self.y)
             self.G.destroy_object(self)
 
     def draw(self):
@@ -300,9 +445,11 @@ class FlyFruit(ClassicObject):
         self.G.draw_spr(45 + off, self.x + 6, self.y - 2)
 
 class Chest(ClassicObject):
+    __slots__ = ('start', 'timer')
+
     def __init__(self, game, x, y, tile=0) -> None:
         super().__init__(game, x, y, tile)
-        game.objects.append(self)
+        game.add_object(self)
         self.spr = 20
         self.x -= 4
         self.start = x
@@ -311,15 +458,17 @@ class Chest(ClassicObject):
     def update(self):
         if self.G.has_key:
             self.timer -= 1
-            self.x = self.start - 1 + random.randint(0, 3)
+            self.x = self.start - 1 + self.G.rng.randint(0, 3)
             if self.timer <= 0:
                 Fruit(self.G, self.x, self.y - 4)
                 self.G.destroy_object(self)
 
 class Key(ClassicObject):
+    __slots__ = ()
+
     def __init__(self, game, x, y, tile=0) -> None:
         super().__init__(game, x, y, tile)
-        game.objects.append(self)
+        game.add_object(self)
 
     def update(self):
         was = math.floor(self.spr)
@@ -332,12 +481,14 @@ class Key(ClassicObject):
             self.G.has_key = True
 
 class Balloon(ClassicObject):
+    __slots__ = ('offset', 'start', 'timer')
+    HITBOX = (-1, -1, 10, 10)
+
     def __init__(self, game, x, y, tile=0) -> None:
         super().__init__(game, x, y, tile)
-        game.objects.append(self)
-        self.offset = random.random()
+        game.add_object(self)
+        self.offset = self.G.rng.random()
         self.start = y
-        self.hitbox = pygame.Rect(-1, -1, 10, 10)
         self.spr = 22
         self.timer = 0
 
@@ -347,20 +498,22 @@ class Balloon(ClassicObject):
             self.y = self.start + math.sin(self.offset) * 2
             hit = self.collide(Player, 0, 0)
             if hit and hit.djump < self.G.max_djump:
-                Smoke(self.G, self.x, self.y)
+                Smoke.spawn(self.G, self.x, self.y)
                 hit.djump = self.G.max_djump
                 self.spr = 0
                 self.timer = 60
         elif self.timer > 0:
             self.timer -= 1
         else:
-            Smoke(self.G, self.x, self.y)
+            Smoke.spawn(self.G, self.x, self.y)
             self.spr = 22
 
 class Spring(ClassicObject):
+    __slots__ = ('hide_in', 'hide_for', 'delay')
+
     def __init__(self, game, x, y, tile=0) -> None:
         super().__init__(game, x, y, tile)
-        game.objects.append(self)
+        game.add_object(self)
         self.hide_in = 0
         self.hide_for = 0
         self.delay = 0
@@ -374,14 +527,14 @@ class Spring(ClassicObject):
                 self.delay = 0
         elif self.spr == 18:
             hit = self.collide(Player, 0, 0)
-            if hit and hit.spd.y >= 0:
+            if hit and hit.spd_y >= 0:
                 self.spr = 19
                 hit.y = self.y - 4
-                hit.spd.x *= 0.2
-                hit.spd.y = -3
+                hit.spd_x *= 0.2
+                hit.spd_y = -3.0
                 hit.djump = self.G.max_djump
                 self.delay = 10
-                Smoke(self.G, self.x, self.y)
+                Smoke.spawn(self.G, self.x, self.y)
 
                 below = self.collide(FallFloor, 0, 1)
                 if below:
@@ -400,17 +553,19 @@ class Spring(ClassicObject):
 
 
 class Platform(ClassicObject):
+    __slots__ = ('last', 'dir')
+    HITBOX = (0, 0, 16, 8)
+
     def __init__(self, game, x, y, tile=0) -> None:
         super().__init__(game, x, y, tile)
-        game.objects.append(self)
+        game.add_object(self)
         self.x -= 4
         self.solids = False
-        self.hitbox.w = 16
         self.last = x
         self.dir = 1
 
     def update(self):
-        self.spd.x = self.dir * 0.65
+        self.spd_x = self.dir * 0.65
         if self.x < -16:
             self.x = 128
         if self.x > 128:
@@ -426,24 +581,28 @@ class Platform(ClassicObject):
         self.G.draw_spr(12, self.x + 8, self.y - 1)
 
 class FakeWall(ClassicObject):
+    __slots__ = ()
+    REACH = (-1, -1, 18, 18)
+    SOLID = (0, 0, 16, 16)
+
     def __init__(self, game, x, y, tile=0) -> None:
         super().__init__(game, x, y, tile)
-        game.objects.append(self)
+        game.add_object(self)
 
     def update(self):
-        self.hitbox = pygame.Rect(-1, -1, 18, 18)
+        self.hitbox = FakeWall.REACH
         hit = self.collide(Player, 0, 0)
         if hit and hit.dash_effect_time > 0:
-            self.spd.x = -self.sign(hit.spd.x) * 1.5
-            self.spd.y = -1.5
+            self.spd_x = -self.sign(hit.spd_x) * 1.5
+            self.spd_y = -1.5
             hit.dash_time = -1
             self.G.destroy_object(self)
-            Smoke(self.G, self.x, self.y)
-            Smoke(self.G, self.x + 8, self.y)
-            Smoke(self.G, self.x, self.y + 8)
-            Smoke(self.G, self.x + 8, self.y + 8)
-            Smoke(self.G, self.x + 4, self.y + 4)
-        self.hitbox = pygame.Rect(0, 0, 16, 16)
+            Smoke.spawn(self.G, self.x, self.y)
+            Smoke.spawn(self.G, self.x + 8, self.y)
+            Smoke.spawn(self.G, self.x, self.y + 8)
+            Smoke.spawn(self.G, self.x + 8, self.y + 8)
+            Smoke.spawn(self.G, self.x + 4, self.y + 4)
+        self.hitbox = FakeWall.SOLID
     
     def draw(self):
        self.G.draw_spr(64, self.x, self.y) 
@@ -452,9 +611,11 @@ class FakeWall(ClassicObject):
        self.G.draw_spr(81, self.x + 8, self.y + 8) 
 
 class Message(ClassicObject):
+    __slots__ = ('last', 'index')
+
     def __init__(self, game, x, y, tile=0) -> None:
         super().__init__(game, x, y, tile)
-        game.objects.append(self)
+        game.add_object(self)
         self.last = 0
         self.index = 0
     
@@ -466,30 +627,33 @@ class Message(ClassicObject):
                 if self.index >= self.last + 1:
                     self.last += 1
 
-                off = pygame.Vector2(8, 96)
+                off_x = 8
+                off_y = 96
                 for i in range(0, int(self.index)):
                     if text[i] != '#':
-                        self.G.rectfill(off.x - 2, off.y - 2, off.x + 7, off.y + 6, 7)
-                        self.G.print("" + text[i], off.x, off.y, 0)
-                        off.x += 5
+                        self.G.rectfill(off_x - 2, off_y - 2, off_x + 7, off_y + 6, 7)
+                        self.G.print(text[i], off_x, off_y, 0)
+                        off_x += 5
                     else:
-                        off.x = 8
-                        off.y += 7
+                        off_x = 8
+                        off_y += 7
         else:
             self.last = 0
             self.index = 0
 
 class Orb(ClassicObject):
+    __slots__ = ()
+
     def __init__(self, game, x, y, tile=0) -> None:
         super().__init__(game, x, y, tile)
-        game.objects.append(self)
-        self.spd.y = -4
+        game.add_object(self)
+        self.spd_y = -4.0
         self.solids = False
     
     def draw(self):
-        self.spd.y = self.G.appr(self.spd.y, 0, 0.5)
+        self.spd_y = self.G.appr(self.spd_y, 0, 0.5)
         hit = self.collide(Player, 0, 0)
-        if self.spd.y == 0 and hit:
+        if self.spd_y == 0 and hit:
             self.G.freeze = 10
             self.G.shake = 10
             self.G.destroy_object(self)
@@ -498,23 +662,18 @@ class Orb(ClassicObject):
         self.G.draw_spr(102, self.x, self.y)
         off = self.G.frames / 30
         for i in range(0, 8):
-            self.G.circfill(self.x + 4 + math.cos(off + i / 8) * 8, self.y + 4 + math.sin(off + i / 8) * 8, 1, 7)
+            self.G.draw_circfill(self.x + 4 + math.cos(off + i / 8) * 8, self.y + 4 + math.sin(off + i / 8) * 8, 1, 7)
     
 
 class BigChest(ClassicObject):
-    class Particle:
-        def __init__(self, x, y, h, spd) -> None:
-            self.x = x
-            self.y = y
-            self.h = h
-            self.spd = spd
+    __slots__ = ('particles', 'state', 'timer')
+    HITBOX = (0, 0, 16, 8)
 
     def __init__(self, game, x, y, tile=0) -> None:
         super().__init__(game, x, y, tile)
-        game.objects.append(self)
+        game.add_object(self)
         self.spr = 96
-        self.particles = []
-        self.hitbox.w = 16
+        self.particles = Particles()
         self.state = 0
         self.timer = 0
     
@@ -522,12 +681,12 @@ class BigChest(ClassicObject):
         if self.state == 0:
             hit = self.collide(Player, 0, 8)
             if hit and hit.is_solid(0, 1):
-                hit.spd.x = 0
-                hit.spd.y = 0
+                hit.spd_x = 0.0
+                hit.spd_y = 0.0
                 self.G.pause_player = True
                 self.state = 1
-                Smoke(self.G, self.x, self.y)
-                Smoke(self.G, self.x + 8, self.y)
+                Smoke.spawn(self.G, self.x, self.y)
+                Smoke.spawn(self.G, self.x + 8, self.y)
                 self.timer = 60
             self.G.draw_spr(96, self.x, self.y)
             self.G.draw_spr(97, self.x + 8, self.y)
@@ -536,12 +695,11 @@ class BigChest(ClassicObject):
             self.G.shake = 5
             self.G.flash_bg = True
             if self.timer <= 45 and len(self.particles) < 50:
-                self.particles.append(BigChest.Particle(
-                    1 + random.randint(0, 14),
+                self.particles.add(
+                    1 + self.G.rng.randint(0, 14),
                     0,
-                    32 + random.randint(0, 32),
-                    8 + random.randint(0, 8)
-                ))
+                    h=32 + self.G.rng.randint(0, 32),
+                    spd_y=8 + self.G.rng.randint(0, 8))
             if self.timer < 0:
                 self.state = 2
                 self.particles.clear()
@@ -549,17 +707,21 @@ class BigChest(ClassicObject):
                 self.G.new_bg = True
                 Orb(self.G, self.x + 4, self.y + 4)
                 self.G.pause_player = False
-            for p in self.particles:
-                p.y += p.spd
-                self.G.rectfill(self.x + p.x, self.y + 8 - p.y, self.x + p.x + 1, min(self.y + 8 - p.y + p.h, self.y + 8), 7)
+            ps = self.particles
+            if len(ps):
+                ps.step()
+                self.G.rectfills(self.x + ps.x, self.y + 8 - ps.y, self.x + ps.x + 1,
+                                 np.minimum(self.y + 8 - ps.y + ps.h, self.y + 8), 7)
 
-        self.G.spr(112, self.x, self.y + 8)
-        self.G.spr(113, self.x + 8, self.y + 8)
+        self.G.draw_spr(112, self.x, self.y + 8)
+        self.G.draw_spr(113, self.x + 8, self.y + 8)
 
 class Flag(ClassicObject):
+    __slots__ = ('score', 'show')
+
     def __init__(self, game, x, y, tile=0) -> None:
         super().__init__(game, x, y, tile)
-        game.objects.append(self)
+        game.add_object(self)
         self.score = 0
         self.show = False
         self.x += 5
@@ -576,10 +738,12 @@ class Flag(ClassicObject):
             self.show = True
 
 class Lifeup(ClassicObject):
+    __slots__ = ('duration', 'flash')
+
     def __init__(self, game, x, y, tile=0) -> None:
         super().__init__(game, x, y, tile)
-        game.objects.append(self)
-        self.spd.y = -0.25
+        game.add_object(self)
+        self.spd_y = -0.25
         self.duration = 30
         self.x -= 2
         self.y -= 4
@@ -596,9 +760,13 @@ class Lifeup(ClassicObject):
         self.G.print("1000", self.x - 2, self.y, int(7 + self.flash % 2))
 
 class Player(ClassicObject):
+    __slots__ = ('p_jump', 'p_dash', 'grace', 'jbuffer', 'djump', 'dash_time', 'dash_effect_time', 'dash_target_x',
+                 'dash_target_y', 'dash_accel_x', 'dash_accel_y', 'spr_off', 'was_on_ground', 'hair')
+    HITBOX = (1, 3, 6, 5)
+
     def __init__(self, game, x, y, tile=0) -> None:
         super().__init__(game, x, y, tile)
-        game.objects.append(self)
+        game.add_object(self)
         self.p_jump = False
         self.p_dash = False
         self.grace = 0
@@ -607,11 +775,12 @@ class Player(ClassicObject):
         self.djump = 1
         self.dash_time = 0
         self.dash_effect_time = 0
-        self.dash_target = pygame.Vector2(0, 0)
-        self.dash_accel = pygame.Vector2(0, 0)
+        self.dash_target_x = 0.0
+        self.dash_target_y = 0.0
+        self.dash_accel_x = 0.0
+        self.dash_accel_y = 0.0
         self.spr_off = 0
         self.was_on_ground = False
-        self.hitbox = pygame.Rect(1, 3, 6, 5)
         self.hair = None
 
     def update(self):
@@ -620,7 +789,8 @@ class Player(ClassicObject):
         
         input = 1 if self.G.btn('right') else -1 if self.G.btn('left') else 0
 
-        if self.G.spikes_at(self.x + self.hitbox.x, self.y + self.hitbox.y, self.hitbox.w, self.hitbox.h, self.spd.x, self.spd.y):
+        hx, hy, hw, hh = self.hitbox
+        if self.G.spikes_at(self.x + hx, self.y + hy, hw, hh, self.spd_x, self.spd_y):
             self.G.kill_player(self)
 
         if self.y > 128:
@@ -629,7 +799,7 @@ class Player(ClassicObject):
         on_ground = self.is_solid(0, 1)
 
         if on_ground and not self.was_on_ground:
-            Smoke(self.G, self.x, self.y + 4)
+            Smoke.spawn(self.G, self.x, self.y + 4)
 
         jump = self.G.btn('jump') and not self.p_jump
         self.p_jump = self.G.btn('jump')
@@ -650,10 +820,10 @@ class Player(ClassicObject):
 
         self.dash_effect_time -= 1
         if self.dash_time > 0:
-            Smoke(self.G, self.x, self.y)
+            Smoke.spawn(self.G, self.x, self.y)
             self.dash_time -= 1
-            self.spd.x = self.G.appr(self.spd.x, self.dash_target.x, self.dash_accel.x)
-            self.spd.y = self.G.appr(self.spd.y, self.dash_target.y, self.dash_accel.y)
+            self.spd_x = self.G.appr(self.spd_x, self.dash_target_x, self.dash_accel_x)
+            self.spd_y = self.G.appr(self.spd_y, self.dash_target_y, self.dash_accel_y)
         else:
             maxrun = 1
             accel = 0.6
@@ -662,28 +832,28 @@ class Player(ClassicObject):
             if not on_ground:
                 accel = 0.4
 
-            if abs(self.spd.x) > maxrun:
-                self.spd.x = self.G.appr(self.spd.x, self.sign(self.spd.x) * maxrun, deaccel)
+            if abs(self.spd_x) > maxrun:
+                self.spd_x = self.G.appr(self.spd_x, self.sign(self.spd_x) * maxrun, deaccel)
             else:
-                self.spd.x = self.G.appr(self.spd.x, input * maxrun, accel)
+                self.spd_x = self.G.appr(self.spd_x, input * maxrun, accel)
 
-            if self.spd.x != 0:
-                self.flipX = (self.spd.x < 0)
+            if self.spd_x != 0:
+                self.flipX = (self.spd_x < 0)
             
             maxfall = 2
             gravity = 0.21
 
-            if abs(self.spd.y) <= 0.15:
+            if abs(self.spd_y) <= 0.15:
                 gravity *= 0.5
             
             # wall slide
             if not on_ground and input != 0 and self.is_solid(input, 0):
                 maxfall = 0.4
-                if random.randint(0, 10) < 2:
-                    Smoke(self.G, self.x + input * 6, self.y)
+                if self.G.rng.randint(0, 10) < 2:
+                    Smoke.spawn(self.G, self.x + input * 6, self.y)
             
             if not on_ground:
-                self.spd.y = self.G.appr(self.spd.y, maxfall, gravity)
+                self.spd_y = self.G.appr(self.spd_y, maxfall, gravity)
 
             # jump 
             if self.jbuffer > 0:
@@ -691,20 +861,20 @@ class Player(ClassicObject):
                     # normal jump
                     self.jbuffer = 0
                     self.grace = 0
-                    self.spd.y = -2
-                    Smoke(self.G, self.x, self.y + 4)
+                    self.spd_y = -2.0
+                    Smoke.spawn(self.G, self.x, self.y + 4)
                 else:
                     # wall jump
                     wall_dir = -1 if self.is_solid(-3, 0) else 1 if self.is_solid(3, 0) else 0
                     if wall_dir != 0:
                         self.jbuffer = 0
-                        self.spd.y = -2
-                        self.spd.x = -wall_dir * (maxrun + 1)
+                        self.spd_y = -2.0
+                        self.spd_x = -wall_dir * (maxrun + 1)
             # dash
             d_full = 5
             d_half = 5 * 0.70710678118
             if self.djump > 0 and dash:
-                Smoke(self.G, self.x, self.y)
+                Smoke.spawn(self.G, self.x, self.y)
                 self.djump -= 1
                 self.dash_time = 4
                 self.G.has_dashed = True
@@ -714,30 +884,31 @@ class Player(ClassicObject):
                 dash_y_input = -1 if self.G.btn('up') else 1 if self.G.btn('down') else 0
 
                 if dash_x_input != 0 and dash_y_input != 0:
-                    self.spd.x = dash_x_input * d_half
-                    self.spd.y = dash_y_input * d_half
+                    self.spd_x = dash_x_input * d_half
+                    self.spd_y = dash_y_input * d_half
                 elif dash_x_input != 0:
-                    self.spd.x = dash_x_input * d_full
-                    self.spd.y = 0
+                    self.spd_x = dash_x_input * d_full
+                    self.spd_y = 0.0
                 else:
-                    self.spd.x = 0
-                    self.spd.y = dash_y_input * d_full
+                    self.spd_x = 0.0
+                    self.spd_y = dash_y_input * d_full
                 self.G.freeze = 3
                 self.G.shake = 6
-                self.dash_target.x = 2 * self.sign(self.spd.x)
-                self.dash_target.y = 2 * self.sign(self.spd.y)
-                self.dash_accel.x = 1.5
-                self.dash_accel.y = 1.5
-
-                if self.spd.y < 0:
-                    self.dash_target.y *= 0.75
-                if self.spd.y != 0:
-                    self.dash_accel.x *= 0.70710678118
-                if self.spd.x != 0:
-                    self.dash_accel.y *= 0.70710678118
+                self.dash_target_x = 2 * self.sign(self.spd_x)
+                self.dash_target_y = 2 * self.sign(self.spd_y)
+                self.dash_accel_x = 1.5
+                self.dash_accel_y = 1.5
+
+                if self.spd_y < 0:
+                    self.dash_target_y *= 0.75
+                if self.spd_y != 0:
+                    self.dash_accel_x *= 0.70710678118
+                if self.spd_x != 0:
+                    self.dash_accel_y *= 0.70710678118
             elif dash and self.djump <= 0:
-                print('dash only smoke')
-                Smoke(self.G, self.x, self.y)
+                if self.G.debug:
+                    print('dash only smoke')
+                Smoke.spawn(self.G, self.x, self.y)
 
 
         self.spr_off += 0.25
@@ -750,7 +921,7 @@ class Player(ClassicObject):
             self.spr = 6
         elif self.G.btn('up'):
             self.spr = 7
-        elif self.spd.x == 0 or (not self.G.btn('left') and not self.G.btn('right')):
+        elif self.spd_x == 0 or (not self.G.btn('left') and not self.G.btn('right')):
             self.spr = 1
         else:  
             self.spr = 1 + int(self.spr_off % 4)
@@ -763,7 +934,7 @@ class Player(ClassicObject):
     def draw(self):
         if self.x < -1 or self.x > 121:
             self.x = self.clamp(self.x, -1, 121)
-            self.spd.x = 0
+            self.spd_x = 0.0
         
         self.draw_player()
     
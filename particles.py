@@ -0,0 +1,48 @@
+#
+# particles.py
+#
+# Particles as columns of numpy arrays instead of one object each, so
+# moving, aging and culling a whole effect is a handful of array ops:
+#
+#   burst = Particles()
+#   burst.add(x, y, spd_x=dx, spd_y=dy, t=10)
+#   burst.step()
+#   burst.keep(burst.t > 0)
+#
+# Game.rectfills draws one rect per particle in a single blits call.
+#
+import numpy as np
+
+class Particles:
+    FIELDS = ('x', 'y', 'spd_x', 'spd_y', 't', 'h')
+
+    def __init__(self):
+        self.clear()
+
+    def __len__(self):
+        return len(self.x)
+
+    def clear(self):
+        for name in Particles.FIELDS:
+            setattr(self, name, np.zeros(0))
+
+    def add(self, x, y, spd_x=0.0, spd_y=0.0, t=0.0, h=0.0):
+        # scalars add one particle, equal length sequences add several
+        values = [np.atleast_1d(np.asarray(v, dtype=np.float64)) for v in (x, y, spd_x, spd_y, t, h)]
+        n = max(len(v) for v in values)
+        for name, v in zip(Particles.FIELDS, values):
+            setattr(self, name, np.concatenate([getattr(self, name), np.broadcast_to(v, (n,))]))
+
+    def step(self):
+        self.x += self.spd_x
+        self.y += self.spd_y
+        self.t -= 1
+
+    def keep(self, mask):
+        if not mask.all():
+            for name in Particles.FIELDS:
+                setattr(self, name, getattr(self, name)[mask])
+
+    def rows(self, *names):
+        # per particle tuples of the named fields, e.g. for snapshots
+        return zip(*[getattr(self, name).tolist() for name in names])
@@ -0,0 +1,49 @@
+#
+# pool.py
+#
+# Fixed-size pools for short lived objects like Smoke and Lifeup. All the
+# instances are made up front and reused, so bursts of spawns allocate
+# nothing:
+#
+#   Smoke.spawn(G, x, y)
+#
+# When every instance is in use the oldest live one is taken over, it is
+# the closest to being gone anyway. A pool that cannot hand out anything
+# drops the spawn.
+#
+class ParticlePool:
+    def __init__(self, cls, capacity):
+        self.cls = cls
+        self.capacity = capacity
+        self.free = [cls.__new__(cls) for i in range(0, capacity)]
+        # live instances in spawn order
+        self.live = {}
+        self.recycled = 0
+
+    def __len__(self):
+        return len(self.live)
+
+    def acquire(self, game):
+        # an uninitialized instance, the caller runs __init__ on it. None
+        # when nothing could be freed, e.g. with a capacity of 0; the spawn
+        # is dropped then
+        if not self.free and self.live:
+            oldest = next(iter(self.live))
+            self.recycled += 1
+            game.destroy_object(oldest)
+            # not in the game's objects any more, take it over anyway
+            self.release(oldest)
+        if not self.free:
+            return None
+        obj = self.free.pop()
+        self.live[obj] = None
+        return obj
+
+    def release(self, obj):
+        if self.live.pop(obj, 0) is None:
+            self.free.append(obj)
+
+    def reset(self):
+        # the room was cleared, everything is free again
+        self.free.extend(self.live)
+        self.live.clear()
@@ -0,0 +1,182 @@
+#
+# profiler.py
+#
+# Per-frame phase timings and hot path counters. A game only pays for this
+# while a Profiler is attached:
+#
+#   prof = Profiler()
+#   prof.attach(G)
+#   ...
+#   prof.export_csv('frames.csv')
+#
+import csv
+import json
+import time
+from collections import Counter, deque
+
+import pygame
+
+from objects import ClassicObject
+
+class Profiler:
+    # room is the time spent in load_room, part of update or movement
+    PHASES = ['events', 'movement', 'update', 'room', 'map', 'draw', 'particles', 'print', 'present']
+    COUNTERS = ['collide', 'is_solid', 'solid_at', 'draw_spr']
+    # the overlay graph is scaled so this many ms fill its height
+    GRAPH_MS = 66.0
+
+    # ClassicObject methods are patched while any game has a profiler
+    patched = {}
+    attached = 0
+
+    def __init__(self, size=900, overlay=False):
+        self.rows = deque(maxlen=size)
+        self.overlay = overlay
+        self.row = None
+        self.frame = 0
+        self.games = []
+
+    def clock(self):
+        return time.perf_counter()
+
+    def attach(self, G):
+        G.profiler = self
+        self.games.append(G)
+        for name in ['solid_at', 'draw_spr']:
+            setattr(G, name, self.counted(name, getattr(G, name)))
+        G.print = self.timed('print', G.print)
+        Profiler.attached += 1
+        if not Profiler.patched:
+            for name in ['collide', 'is_solid']:
+                Profiler.patched[name] = getattr(ClassicObject, name)
+                setattr(ClassicObject, name, Profiler.counted_method(name, Profiler.patched[name]))
+
+    def detach(self, G):
+        for name in ['solid_at', 'draw_spr', 'print']:
+            delattr(G, name)
+        G.profiler = None
+        self.games.remove(G)
+        Profiler.attached -= 1
+        if Profiler.attached == 0:
+            for name, method in Profiler.patched.items():
+                setattr(ClassicObject, name, method)
+            Profiler.patched.clear()
+
+    def counted(self, name, fn):
+        def wrapper(*args, **kwargs):
+            self.count(name)
+            return fn(*args, **kwargs)
+        return wrapper
+
+    def timed(self, phase, fn):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = fn(*args, **kwargs)
+            self.add(phase, time.perf_counter() - start)
+            return result
+        return wrapper
+
+    @staticmethod
+    def counted_method(name, method):
+        def wrapper(obj, *args):
+            prof = obj.G.profiler
+            if prof is not None:
+                prof.count(name)
+            return method(obj, *args)
+        return wrapper
+
+    def begin_frame(self):
+        # opens a row unless one is already open, so the caller that owns the
+        # loop (main, headless) can open it before polling events
+        if self.row is None:
+            self.row = {'frame': self.frame, 'start': time.perf_counter()}
+            for phase in Profiler.PHASES:
+                self.row[phase] = 0.0
+            for name in Profiler.COUNTERS:
+                self.row[name] = 0
+
+    def add(self, phase, seconds):
+        if self.row is not None:
+            self.row[phase] = self.row.get(phase, 0.0) + seconds
+
+    def lap(self, phase, since):
+        now = time.perf_counter()
+        self.add(phase, now - since)
+        return now
+
+    def count(self, name):
+        if self.row is not None:
+            self.row[name] += 1
+
+    def end_frame(self, G):
+        if self.row is None:
+            return
+        row = self.row
+        row['total'] = time.perf_counter() - row.pop('start')
+        for name, n in Counter(type(obj).__name__ for obj in G.objects if obj).items():
+            row['objects:' + name] = n
+        self.rows.append(row)
+        self.row = None
+        self.frame += 1
+
+    def update_objects(self, G):
+        # Game.update's object loop with movement and per-class update timed
+        clock = time.perf_counter
+        for obj in G.objects:
+            if obj:
+                start = clock()
+                obj.move(obj.spd_x, obj.spd_y)
+                moved = clock()
+                obj.update()
+                done = clock()
+                self.add('movement', moved - start)
+                self.add('update', done - moved)
+                self.add('update:' + type(obj).__name__, done - moved)
+
+    def columns(self):
+        names = ['frame', 'total'] + Profiler.PHASES + Profiler.COUNTERS
+        extra = set()
+        for row in self.rows:
+            extra.update(key for key in row if key not in names)
+        return names + sorted(extra)
+
+    def export_csv(self, path):
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=self.columns(), restval=0)
+            writer.writeheader()
+            writer.writerows(self.rows)
+
+    def export_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(list(self.rows), f)
+
+    def export(self, path):
+        if path.endswith('.json'):
+            self.export_json(path)
+        else:
+            self.export_csv(path)
+
+    def summary(self):
+        # mean ms per phase over the buffered frames
+        n = max(1, len(self.rows))
+        return {phase: 1000 * sum(row.get(phase, 0.0) for row in self.rows) / n for phase in ['total'] + Profiler.PHASES}
+
+    def draw_overlay(self, G):
+        # one bar per buffered frame along the bottom of the canvas, the
+        # line marks the 30 fps budget
+        canvas = G.canvas
+        if canvas is None:
+            return
+        height = 24
+        bottom = canvas.get_height() - 1
+        rows = list(self.rows)[-canvas.get_width():]
+        for x in range(0, len(rows)):
+            ms = 1000 * rows[x]['total']
+            h = min(height, int(ms / Profiler.GRAPH_MS * height))
+            color = G.COLORS[11] if ms < 1000 / 30 else G.COLORS[8]
+            pygame.draw.line(canvas, color, (x, bottom), (x, bottom - h))
+        budget = bottom - int(1000 / 30 / Profiler.GRAPH_MS * height)
+        pygame.draw.line(canvas, G.COLORS[7], (0, budget), (canvas.get_width() - 1, budget))
+        G.mark(pygame.Rect(0, bottom - height, canvas.get_width(), height + 1))
+        if rows:
+            G.print("{:.1f}ms".format(1000 * rows[-1]['total']), 1, 1, 7)
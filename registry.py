@@ -0,0 +1,101 @@
+#
+# registry.py
+#
+class ObjectRegistry:
+    CELL = 16
+    # every hitbox lies within [-8, 24) of its object's position, so an object
+    # can only touch a rect if its position is at most this far outside it
+    REACH_BEFORE = 24
+    REACH_AFTER = 8
+    # buckets this small are cheaper to scan than to look up in the grid
+    SCAN = 8
+
+    def __init__(self):
+        # buckets and grid cells are dicts of obj -> None, which keep spawn
+        # order like a list but drop an object in O(1)
+        self.buckets = {}
+        self.grid = {}
+        self.serial = 0
+
+    def cell_of(self, x, y):
+        return (int(x // ObjectRegistry.CELL), int(y // ObjectRegistry.CELL))
+
+    def add(self, obj):
+        ty = type(obj)
+        self.serial += 1
+        obj.serial = self.serial
+        obj.cell = self.cell_of(obj.x, obj.y)
+        self.buckets.setdefault(ty, {})[obj] = None
+        self.grid.setdefault((ty, obj.cell), {})[obj] = None
+
+    def remove(self, obj):
+        if obj.cell is None:
+            return
+        ty = type(obj)
+        del self.buckets[ty][obj]
+        del self.grid[(ty, obj.cell)][obj]
+        obj.cell = None
+
+    def moved(self, obj, cell):
+        ty = type(obj)
+        del self.grid[(ty, obj.cell)][obj]
+        obj.cell = cell
+        self.grid.setdefault((ty, cell), {})[obj] = None
+
+    def clear(self):
+        for bucket in self.buckets.values():
+            for obj in bucket:
+                obj.cell = None
+        self.buckets.clear()
+        self.grid.clear()
+
+    def near(self, ty, x, y, w, h):
+        # objects of type ty that might touch the rect; a superset, callers
+        # still run the exact overlap test
+        bucket = self.buckets.get(ty)
+        if not bucket:
+            return ()
+        if len(bucket) <= ObjectRegistry.SCAN:
+            return bucket
+        found = []
+        left = int((x - ObjectRegistry.REACH_BEFORE) // ObjectRegistry.CELL)
+        right = int((x + w + ObjectRegistry.REACH_AFTER) // ObjectRegistry.CELL)
+        top = int((y - ObjectRegistry.REACH_BEFORE) // ObjectRegistry.CELL)
+        bottom = int((y + h + ObjectRegistry.REACH_AFTER) // ObjectRegistry.CELL)
+        for cx in range(left, right + 1):
+            for cy in range(top, bottom + 1):
+                found.extend(self.grid.get((ty, (cx, cy)), ()))
+        return found
+
+    def first(self, ty, other, ox, oy):
+        # the first object of type ty (in spawn order) overlapping other's
+        # hitbox moved by ox, oy; same answer as scanning Game.objects
+        bucket = self.buckets.get(ty)
+        if not bucket:
+            return None
+        x = other._x
+        y = other._y
+        hb = other.hitbox
+        hx, hy, hw, hh = hb
+        if len(bucket) <= ObjectRegistry.SCAN:
+            for obj in bucket:
+                if obj is not other and obj.collideable and self.overlaps(obj, x, y, hb, ox, oy):
+                    return obj
+            return None
+
+        found = None
+        for obj in self.near(ty, x + hx + ox, y + hy + oy, hw, hh):
+            if obj is not other and obj.collideable and (found is None or obj.serial < found.serial) and \
+                self.overlaps(obj, x, y, hb, ox, oy):
+                found = obj
+        return found
+
+    def overlaps(self, obj, x, y, hb, ox, oy):
+        # obj against a hitbox hb at x, y moved by ox, oy. reads the backing
+        # fields, the x/y properties only matter for writes
+        bx, by, bw, bh = obj.hitbox
+        hx, hy, hw, hh = hb
+        return obj._x + bx + bw > x + hx + ox and \
+            obj._y + by + bh > y + hy + oy and \
+            obj._x + bx < x + hx + hw + ox and \
+            obj._y + by < y + hy + hh + oy
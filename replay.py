@@ -0,0 +1,101 @@
+#
+# replay.py
+#
+# Records the input bitmask of every frame together with the game's seed,
+# and plays recordings back headless as fast as possible:
+#
+#   python app.py --record run.rec
+#   python replay.py run.rec
+#
+import argparse
+import hashlib
+import struct
+import time
+import random
+
+from app import Game
+
+class Recording:
+    MAGIC = b'CRC1'
+    # magic, seed, frame count
+    HEADER = struct.Struct('<4sQI')
+
+    def __init__(self, seed, masks=None):
+        self.seed = seed
+        self.masks = bytearray(masks or b'')
+
+    def __len__(self):
+        return len(self.masks)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(Recording.HEADER.pack(Recording.MAGIC, self.seed, len(self.masks)))
+            f.write(self.masks)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, seed, frames = Recording.HEADER.unpack_from(data)
+        if magic != Recording.MAGIC:
+            raise ValueError("{} is not a recording".format(path))
+        start = Recording.HEADER.size
+        masks = data[start:start + frames]
+        if len(masks) != frames:
+            raise ValueError("{} is truncated".format(path))
+        return Recording(seed, masks)
+
+def random_mask(rng):
+    # anding two draws holds each button down about a quarter of the time
+    return rng.getrandbits(len(Game.BUTTONS)) & rng.getrandbits(len(Game.BUTTONS))
+
+def random_masks(rng, frames, hold=4):
+    # random inputs for test and benchmark runs, each held for a few
+    # frames like a player would
+    masks = bytearray()
+    mask = 0
+    for f in range(0, frames):
+        if f % hold == 0:
+            mask = random_mask(rng)
+        masks.append(mask)
+    return masks
+
+class Recorder:
+    def __init__(self, seed=None):
+        if seed is None:
+            seed = random.getrandbits(63)
+        self.recording = Recording(seed)
+
+    def record(self, G):
+        # call once per frame, right before G.step()
+        self.recording.masks.append(G.input_mask())
+
+def play(recording, surface=None, until=None):
+    # feeds the recording into a fresh game; until(G, frame) can stop early
+    G = Game(surface, seed=recording.seed)
+    for i in range(0, len(recording.masks)):
+        if until and until(G, i):
+            break
+        G.set_input_mask(recording.masks[i])
+        G.step()
+    return G
+
+def state_digest(G):
+    # hash of the simulation state, equal digests mean the runs agree
+    return hashlib.sha1(G.snapshot()).hexdigest()
+
+def main():
+    parser = argparse.ArgumentParser(description='play a recording back headless')
+    parser.add_argument('path')
+    args = parser.parse_args()
+
+    recording = Recording.load(args.path)
+    start = time.perf_counter()
+    G = play(recording)
+    elapsed = time.perf_counter() - start
+    print("{} frames, room {} {}, deaths {}, {:.1f} frames/s".format(
+        len(recording), G.room_x, G.room_y, G.deaths, len(recording) / elapsed if elapsed > 0 else float('inf')))
+    print("state {}".format(state_digest(G)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+#
+# rewind.py
+#
+# Keeps the last few seconds of play in a fixed size ring of save states.
+# Every keyframe_every frames a full Game.snapshot() is stored; the frames
+# in between only keep the 32 byte chunks that changed since the frame
+# before. The random state at the end of every snapshot has a fixed size,
+# so it is diffed on its own even when objects spawn or die.
+#
+import sys
+
+class Rewind:
+    CHUNK = 32
+    # random words, their index and gauss_next at the end of a snapshot
+    TAIL = 625 * 4 + 8
+
+    def __init__(self, seconds=10, keyframe_every=30, max_bytes=None, fps=30):
+        self.capacity = max(1, int(seconds * fps))
+        self.keyframe_every = keyframe_every
+        self.max_bytes = max_bytes
+        self.entries = [None] * self.capacity
+        self.sizes = [0] * self.capacity
+        self.first = 0
+        self.count = 0
+        self.nbytes = 0
+        self.since_key = 0
+        # snapshot of the newest frame, deltas are taken against it
+        self.last = None
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.entries = [None] * self.capacity
+        self.sizes = [0] * self.capacity
+        self.first = 0
+        self.count = 0
+        self.nbytes = 0
+        self.since_key = 0
+        self.last = None
+
+    def diff(self, old, new):
+        # (offset, bytes) for the chunks of new that differ from old
+        chunk = Rewind.CHUNK
+        return [(i, new[i:i + chunk]) for i in range(0, len(new), chunk) if old[i:i + chunk] != new[i:i + chunk]]
+
+    def delta(self, old, new):
+        split_old = len(old) - Rewind.TAIL
+        split_new = len(new) - Rewind.TAIL
+        head_old, head_new = old[:split_old], new[:split_new]
+        if len(head_old) == len(head_new):
+            head = self.diff(head_old, head_new)
+            full = None
+        else:
+            head = None
+            full = head_new
+        return (full, head, self.diff(old[split_old:], new[split_new:]))
+
+    def apply(self, old, entry):
+        full, head, tail = entry
+        split = len(old) - Rewind.TAIL
+        if full is not None:
+            data = bytearray(full)
+        else:
+            data = bytearray(old[:split])
+            for i, chunk in head:
+                data[i:i + len(chunk)] = chunk
+        start = len(data)
+        data += old[split:]
+        for i, chunk in tail:
+            data[start + i:start + i + len(chunk)] = chunk
+        return bytes(data)
+
+    def size_of(self, entry):
+        if isinstance(entry, bytes):
+            return len(entry)
+        full, head, tail = entry
+        size = sys.getsizeof(entry)
+        if full is not None:
+            size += len(full)
+        for i, chunk in (head or []) + tail:
+            size += len(chunk) + 16
+        return size
+
+    def push(self, G):
+        # called by Game.step between update and render
+        data = G.snapshot()
+        if self.last is None or self.since_key + 1 >= self.keyframe_every:
+            entry = data
+            self.since_key = 0
+        else:
+            entry = self.delta(self.last, data)
+            self.since_key += 1
+        self.last = data
+
+        if self.count == self.capacity:
+            self.drop_oldest()
+        index = (self.first + self.count) % self.capacity
+        self.entries[index] = entry
+        self.sizes[index] = self.size_of(entry)
+        self.nbytes += self.sizes[index]
+        self.count += 1
+        while self.max_bytes is not None and self.nbytes > self.max_bytes and self.count > 1:
+            self.drop_oldest()
+
+    def drop_oldest(self):
+        oldest = self.entries[self.first]
+        after = (self.first + 1) % self.capacity
+        if self.count > 1 and not isinstance(self.entries[after], bytes):
+            # the next frame becomes the keyframe its deltas start from
+            promoted = self.apply(oldest, self.entries[after])
+            self.nbytes += len(promoted) - self.sizes[after]
+            self.entries[after] = promoted
+            self.sizes[after] = len(promoted)
+        self.nbytes -= self.sizes[self.first]
+        self.entries[self.first] = None
+        self.sizes[self.first] = 0
+        self.first = after
+        self.count -= 1
+
+    def state(self, back):
+        # snapshot of the frame back frames before the newest one
+        n = self.count - 1 - back
+        key = n
+        while not isinstance(self.entries[(self.first + key) % self.capacity], bytes):
+            key -= 1
+        data = self.entries[(self.first + key) % self.capacity]
+        for i in range(key + 1, n + 1):
+            data = self.apply(data, self.entries[(self.first + i) % self.capacity])
+        return data
+
+    def step_back(self, G):
+        # drops the newest frame and puts G back to the one before it,
+        # returns False once there is nothing left to rewind to
+        if self.count < 2:
+            return False
+        data = self.state(1)
+        index = (self.first + self.count - 1) % self.capacity
+        self.nbytes -= self.sizes[index]
+        self.entries[index] = None
+        self.sizes[index] = 0
+        self.count -= 1
+        self.last = data
+        # keyframe spacing continues from the frame we are back at
+        self.since_key = 0
+        n = self.count - 1
+        while not isinstance(self.entries[(self.first + n) % self.capacity], bytes):
+            n -= 1
+            self.since_key += 1
+
+        G.restore(data)
+        G.redraw()
+        return True
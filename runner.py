@@ -0,0 +1,170 @@
+#
+# runner.py
+#
+# Runs many independent headless episodes on a process pool. A job is a
+# (room, seed, masks) tuple: the game starts in room (rx, ry) with the seed
+# and is fed one input mask per frame. The workers are started once and
+# reused for every run; the compiled map and the per-room tables are built
+# in the parent before the workers fork, so they inherit them instead of
+# building their own (with spawn, each worker maps the compiled map from
+# .cache/ once). Player positions come back through one shared memory
+# block of (jobs, frames, 2) float32s, NaN while there is no player:
+#
+#   with Runner() as runner:
+#       results, traces = runner.run([((0, 0), 1, masks), ...])
+#
+#   python runner.py --jobs 256 --frames 900
+#
+import argparse
+import hashlib
+import multiprocessing
+import os
+import random
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from app import Game
+from objects import Player
+from replay import random_masks
+
+class Result:
+    def __init__(self, index, frames, survived, deaths, rooms, fruit, digest):
+        self.index = index
+        self.frames = frames
+        # frames stepped before the first death
+        self.survived = survived
+        self.deaths = deaths
+        # rooms left through the top, counted by level_index going up
+        self.rooms = rooms
+        self.fruit = fruit
+        self.digest = digest
+
+    def __repr__(self):
+        return "Result({}, frames={}, survived={}, deaths={}, rooms={}, fruit={}, {})".format(
+            self.index, self.frames, self.survived, self.deaths, self.rooms, self.fruit, self.digest[:12])
+
+def warm():
+    # builds every room's tables into the shared Map class attributes
+    G = Game(None, seed=0)
+    for ry in range(0, 4):
+        for rx in range(0, 8):
+            G.load_room(rx, ry)
+
+def episode(room, seed, masks, trace=None):
+    # trace is a (frames, 2) array for the player position of every frame
+    G = Game(None, seed=seed)
+    G.load_room(*room)
+    survived = None
+    rooms = 0
+    level = G.level_index()
+    for i in range(0, len(masks)):
+        G.set_input_mask(masks[i])
+        G.step()
+        if survived is None and G.deaths > 0:
+            survived = i
+        if G.level_index() > level:
+            rooms += G.level_index() - level
+        level = G.level_index()
+        if trace is not None:
+            player = next((obj for obj in G.objects if type(obj) is Player), None)
+            if player is not None:
+                trace[i] = (player.x, player.y)
+    return (len(masks), len(masks) if survived is None else survived, G.deaths, rooms,
+            len(G.got_fruit), hashlib.sha1(G.snapshot()).hexdigest())
+
+# the shared memory block of the current run, opened once per worker
+attached = {}
+
+def traces_of(name, shape):
+    if name not in attached:
+        for block in attached.values():
+            block.close()
+        attached.clear()
+        attached[name] = shared_memory.SharedMemory(name)
+    return np.ndarray(shape, dtype=np.float32, buffer=attached[name].buf)
+
+def work(task):
+    index, room, seed, masks, name, shape = task
+    trace = traces_of(name, shape)[index] if name is not None else None
+    return (index,) + episode(room, seed, masks, trace)
+
+class Runner:
+    def __init__(self, processes=None):
+        self.processes = processes or os.cpu_count()
+        warm()
+        # workers share the parent's tracker, which would otherwise have
+        # each of them unlink the blocks it attached to when it exits
+        resource_tracker.ensure_running()
+        self.pool = multiprocessing.Pool(self.processes, initializer=warm)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def run(self, jobs, trace=True):
+        # returns the results in job order and the (jobs, frames, 2) traces
+        frames = max([len(masks) for room, seed, masks in jobs] + [1])
+        shape = (len(jobs), frames, 2)
+        block = shared_memory.SharedMemory(create=True, size=4 * shape[0] * shape[1] * shape[2]) if trace else None
+        try:
+            if block is not None:
+                np.ndarray(shape, dtype=np.float32, buffer=block.buf).fill(np.nan)
+            tasks = [(i, room, seed, bytes(masks), block.name if block else None, shape)
+                     for i, (room, seed, masks) in enumerate(jobs)]
+            results = [None] * len(jobs)
+            chunk = max(1, len(jobs) // (self.processes * 4))
+            for values in self.pool.imap_unordered(work, tasks, chunk):
+                results[values[0]] = Result(*values)
+            traces = np.ndarray(shape, dtype=np.float32, buffer=block.buf).copy() if block else None
+        finally:
+            if block is not None:
+                block.close()
+                block.unlink()
+        return results, traces
+
+def random_jobs(n, frames, seed):
+    rng = random.Random(seed)
+    rooms = [(0, 0), (1, 0), (2, 0), (3, 0), (4, 0)]
+    return [(rooms[i % len(rooms)], i, random_masks(rng, frames)) for i in range(0, n)]
+
+def main():
+    parser = argparse.ArgumentParser(description='run headless episodes on every core')
+    parser.add_argument('--jobs', type=int, default=256)
+    parser.add_argument('--frames', type=int, default=900)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--serial', type=int, default=16, metavar='N', help='also run the first N jobs in this process to compare')
+    args = parser.parse_args()
+
+    jobs = random_jobs(args.jobs, args.frames, args.seed)
+    with Runner(args.processes) as runner:
+        start = time.perf_counter()
+        results, traces = runner.run(jobs)
+        elapsed = time.perf_counter() - start
+    steps = sum(result.frames for result in results)
+    print("{} jobs on {} processes, {:.0f} steps/s, {} deaths, {} rooms cleared, {} fruit".format(
+        len(jobs), runner.processes, steps / elapsed, sum(r.deaths for r in results),
+        sum(r.rooms for r in results), sum(r.fruit for r in results)))
+
+    if args.serial > 0:
+        start = time.perf_counter()
+        mismatches = 0
+        for i, (room, seed, masks) in enumerate(jobs[:args.serial]):
+            trace = np.full((args.frames, 2), np.nan, dtype=np.float32)
+            values = episode(room, seed, masks, trace)
+            if values[-1] != results[i].digest or not np.array_equal(trace, traces[i], equal_nan=True):
+                mismatches += 1
+        elapsed = time.perf_counter() - start
+        steps = sum(len(masks) for room, seed, masks in jobs[:args.serial])
+        print("serial {:.0f} steps/s, {} of {} jobs differ".format(steps / elapsed, mismatches, args.serial))
+
+if __name__ == '__main__':
+    main()
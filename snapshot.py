@@ -0,0 +1,171 @@
+#
+# snapshot.py
+#
+# Save states for a whole Game as a flat binary blob. Everything is written
+# as one value list plus a struct format string recording each value's
+# type, so ints stay ints and floats stay floats on the way back and a
+# restored game steps exactly like the original. The random state goes
+# last as raw words.
+#
+import struct
+from array import array
+
+import pygame
+
+from objects import *
+from particles import Particles
+
+MAGIC = b'CSN1'
+# magic, format length, value bytes length, gauss_next present
+HEADER = struct.Struct('<4sIIB')
+KINDS = {int: 'q', float: 'd', bool: '?'}
+
+GAME_FIELDS = ['room_x', 'room_y', 'frames', 'deaths', 'will_restart', 'delay_restart', 'shake',
+               'max_djump', 'has_dashed', 'has_key', 'freeze', 'pause_player', 'flash_bg', 'new_bg',
+               'start_game', 'start_game_flash']
+OBJECT_FIELDS = ['type', 'spr', 'flipX', 'flipY', 'solids', 'collideable', '_x', '_y', 'spd_x', 'spd_y', 'rem_x', 'rem_y']
+# per class state on top of OBJECT_FIELDS and the hitbox; hair and
+# particles are handled below
+CLASSES = [
+    (PlayerSpawn, ['state', 'delay', 'target_x', 'target_y']),
+    (Smoke, []),
+    (FakeWall, []),
+    (FallFloor, ['state', 'solid', 'delay']),
+    (Fruit, ['start', 'off']),
+    (FlyFruit, ['start', 'fly', 'step']),
+    (Chest, ['start', 'timer']),
+    (Key, []),
+    (Balloon, ['offset', 'start', 'timer']),
+    (Spring, ['hide_in', 'hide_for', 'delay']),
+    (Platform, ['last', 'dir']),
+    (Message, ['last', 'index']),
+    (Orb, []),
+    (BigChest, ['state', 'timer']),
+    (Flag, ['score', 'show']),
+    (Lifeup, ['duration', 'flash']),
+    (Player, ['p_jump', 'p_dash', 'grace', 'jbuffer', 'djump', 'dash_time', 'dash_effect_time',
+              'spr_off', 'was_on_ground', 'dash_target_x', 'dash_target_y', 'dash_accel_x', 'dash_accel_y']),
+]
+CLASS_IDS = {CLASSES[i][0]: i for i in range(0, len(CLASSES))}
+# restored objects share the class hitboxes again
+HITBOXES = {box: box for box in [ClassicObject.HITBOX, FakeWall.REACH, FakeWall.SOLID] + [cls.HITBOX for cls, fields in CLASSES]}
+
+def snapshot(G):
+    values = [getattr(G, name) for name in GAME_FIELDS]
+    values += [G.shakeoffset.x, G.shakeoffset.y, G.input_mask()]
+
+    values.append(len(G.got_fruit))
+    values += list(G.got_fruit)
+
+    values.append(len(G.dead_particles))
+    for p in G.dead_particles.rows('x', 'y', 't', 'spd_x', 'spd_y'):
+        values += p
+
+    objs = [obj for obj in G.objects if obj]
+    values.append(len(objs))
+    for obj in objs:
+        cls = type(obj)
+        class_id = CLASS_IDS[cls]
+        values.append(class_id)
+        values += [getattr(obj, name) for name in OBJECT_FIELDS]
+        values += obj.hitbox
+        values += [getattr(obj, name) for name in CLASSES[class_id][1]]
+        if cls is PlayerSpawn or cls is Player:
+            hair = obj.hair.hair if obj.hair else ()
+            values.append(len(hair))
+            values += hair
+        elif cls is BigChest:
+            values.append(len(obj.particles))
+            for p in obj.particles.rows('x', 'y', 'h', 'spd_y'):
+                values += p
+
+    fmt = '<' + ''.join([KINDS[type(v)] for v in values])
+    packed = struct.pack(fmt, *values)
+    version, words, gauss = G.rng.getstate()
+    fmt = fmt.encode()
+    return b''.join([
+        HEADER.pack(MAGIC, len(fmt), len(packed), gauss is not None),
+        fmt, packed,
+        array('I', words).tobytes(),
+        struct.pack('<d', gauss if gauss is not None else 0.0)])
+
+def restore(G, data):
+    magic, fmt_len, packed_len, has_gauss = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("not a snapshot")
+    offset = HEADER.size
+    fmt = data[offset:offset + fmt_len].decode()
+    offset += fmt_len
+    values = struct.unpack_from(fmt, data, offset)
+    offset += packed_len
+    words = array('I')
+    words.frombytes(data[offset:-8])
+    gauss = struct.unpack_from('<d', data, len(data) - 8)[0]
+    G.rng.setstate((3, tuple(words), gauss if has_gauss else None))
+
+    i = len(GAME_FIELDS)
+    room = (G.room_x, G.room_y)
+    for name, value in zip(GAME_FIELDS, values):
+        setattr(G, name, value)
+    G.shakeoffset = pygame.Vector2(values[i], values[i + 1])
+    G.set_input_mask(values[i + 2])
+    i += 3
+    if (G.room_x, G.room_y) != room or G.flag_sums is None:
+        G.flag_sums = G.map.flag_sums(G.room_x, G.room_y)
+        G.spike_sums = G.map.spike_sums(G.room_x, G.room_y)
+        G.layer = None
+
+    n = values[i]
+    G.got_fruit = {k: 1 for k in values[i + 1:i + 1 + n]}
+    i += 1 + n
+
+    n = values[i]
+    i += 1
+    G.dead_particles.clear()
+    if n > 0:
+        x, y, t, spd_x, spd_y = zip(*[values[i + 5 * j:i + 5 * j + 5] for j in range(0, n)])
+        G.dead_particles.add(x, y, spd_x=spd_x, spd_y=spd_y, t=t)
+        i += 5 * n
+
+    G.objects.clear()
+    G.registry.clear()
+    for pool in G.pools.values():
+        pool.reset()
+    n = values[i]
+    i += 1
+    for j in range(0, n):
+        cls, fields = CLASSES[values[i]]
+        i += 1
+        # no __init__, constructors spawn smoke and draw random numbers
+        pool = G.pools.get(cls)
+        obj = pool.acquire(G) if pool is not None else None
+        if obj is None:
+            obj = cls.__new__(cls)
+        obj.G = G
+        obj.cell = None
+        obj.serial = 0
+        for name in OBJECT_FIELDS:
+            setattr(obj, name, values[i])
+            i += 1
+        obj.hitbox = HITBOXES.get(values[i:i + 4], values[i:i + 4])
+        i += 4
+        for name in fields:
+            setattr(obj, name, values[i])
+            i += 1
+        if cls is PlayerSpawn or cls is Player:
+            count = values[i]
+            i += 1
+            obj.hair = None
+            if count > 0:
+                obj.hair = PlayerHair(G, 0, 0)
+                obj.hair.hair = array('d', values[i:i + count])
+                i += count
+        elif cls is BigChest:
+            count = values[i]
+            i += 1
+            obj.particles = Particles()
+            if count > 0:
+                x, y, h, spd_y = zip(*[values[i + 4 * k:i + 4 * k + 4] for k in range(0, count)])
+                obj.particles.add(x, y, spd_y=spd_y, h=h)
+                i += 4 * count
+        G.add_object(obj)